@@ -0,0 +1,66 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import random
+import sys
+import time
+from array import array
+
+# Third-party imports
+
+# Local imports
+from isac.history import encode_block, decode_block, pack_columns
+
+
+def _series(count, jitter, step):
+    timestamps = array('d')
+    values = array('d')
+    ts = time.time()
+    value = 20.0
+    for i in range(count):
+        ts += 0.1 + random.gauss(0, jitter)
+        value += random.choice((0, 0, step, -step))
+        timestamps.append(ts)
+        values.append(value)
+    return timestamps, values, [{'unit': 'C'}] * count
+
+
+def _json_size(timestamps, values, tags):
+    return len(json.dumps(list(zip(values, timestamps, tags))).encode())
+
+
+def main(count=100000):
+    series = [
+        ('regular, constant', _series(count, 0, 0)),
+        ('regular, steps of 0.5', _series(count, 0, 0.5)),
+        ('1ms jitter, steps of 0.5', _series(count, 0.001, 0.5)),
+        ('1ms jitter, steps of 0.1', _series(count, 0.001, 0.1)),
+    ]
+
+    print('%-26s %8s %8s %8s %10s %10s' % (
+        'series', 'json', 'columnar', 'codec', 'encode', 'decode'))
+    for name, columns in series:
+        start = time.perf_counter()
+        block = encode_block(*columns)
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decode_block(block)
+        decode_time = time.perf_counter() - start
+
+        columnar_size = len(json.dumps(pack_columns(*columns)).encode())
+        print('%-26s %8.2f %8.2f %8.2f %10.0f %10.0f' % (
+            name, _json_size(*columns) / count, columnar_size / count, len(block) / count,
+            count / encode_time, count / decode_time
+        ))
+
+    print('(sizes in bytes/point, throughputs in points/s)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,90 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import random
+import sys
+import time
+
+# Third-party imports
+
+# Local imports
+from isac.transport import CODECS
+from isac.transport.zmq_pub_sub import topic_id
+
+TAGS = {'peer_name': 'sensors', 'peer_uuid': '8c1b8bb4-2f5e-4b8e-9a4a-0d7c1e2b3f4a'}
+
+
+def _updates(count, make_value):
+    ts = time.time()
+    return [(make_value(), ts + i * 0.1, dict(TAGS)) for i in range(count)]
+
+
+def _batches(updates, size=100):
+    items = [('sensor://room/%d/temperature' % i, update) for i, update in enumerate(updates)]
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _topics(count):
+    # Topic frame size and subscriber lookup, raw URIs against topic IDs
+    uris = ['sensor://building/floor-%d/room-%d/temperature' % (i % 10, i) for i in range(1000)]
+    by_uri = set(uris)
+    by_id = {topic_id(uri): uri for uri in uris}
+    frames = [uri.encode() for uri in uris] * (count // len(uris))
+    id_frames = [topic_id(uri) for uri in uris] * (count // len(uris))
+
+    start = time.perf_counter()
+    for frame in frames:
+        frame.decode() in by_uri
+    uri_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for frame in id_frames:
+        by_id.get(frame)
+    id_time = time.perf_counter() - start
+
+    print('%-22s %8s %10s' % ('topics', 'bytes', 'lookups/s'))
+    print('%-22s %8.2f %10.0f' % ('raw URIs', sum(map(len, frames)) / len(frames),
+                                  len(frames) / uri_time))
+    print('%-22s %8.2f %10.0f' % ('topic IDs', sum(map(len, id_frames)) / len(id_frames),
+                                  len(id_frames) / id_time))
+
+
+def main(count=100000):
+    updates = [
+        ('float values', _updates(count, lambda: random.uniform(-20, 40))),
+        ('int values', _updates(count, lambda: random.randint(0, 1000))),
+        ('string values', _updates(count, lambda: random.choice(('on', 'off')))),
+    ]
+    updates.append(('batches of 100 floats', _batches(updates[0][1])))
+
+    print('%-22s %-8s %8s %10s %10s' % ('payloads', 'codec', 'bytes', 'encode', 'decode'))
+    for name, payloads in updates:
+        points = count if 'batch' in name else len(payloads)
+        for codec_name in sorted(CODECS):
+            codec = CODECS[codec_name]
+
+            start = time.perf_counter()
+            encoded = [codec.encode(payload) for payload in payloads]
+            encode_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for payload in encoded:
+                codec.decode(payload)
+            decode_time = time.perf_counter() - start
+
+            print('%-22s %-8s %8.2f %10.0f %10.0f' % (
+                name, codec_name, sum(map(len, encoded)) / points,
+                points / encode_time, points / decode_time
+            ))
+
+    print('(sizes in bytes/update, throughputs in updates/s)')
+    print()
+    _topics(count)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
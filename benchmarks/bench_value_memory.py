@@ -0,0 +1,43 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import gc
+import sys
+import tracemalloc
+
+# Third-party imports
+
+# Local imports
+from isac import IsacNode, IsacValue
+
+
+def main(count=5000):
+    node = IsacNode('bench')
+    try:
+        values = []
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        for i in range(count):
+            values.append(IsacValue(
+                node, 'bench://value_memory/%d' % i, i,
+                survey_last_value=False, survey_static_tags=False
+            ))
+
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        print('%d values: %.0f bytes/value' % (count, total / count))
+    finally:
+        node.shutdown()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,59 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import time
+
+# Third-party imports
+
+# Local imports
+from isac import IsacNode, IsacValue
+from isac.tools import AlwaysYield, NeverYield, YieldEvery, YieldTimeSliced
+
+
+def _reads_per_sec(iv, duration=1.0):
+    reads = 0
+    start = time.perf_counter()
+    while (time.perf_counter() - start) < duration:
+        for i in range(100):
+            iv.value
+        reads += 100
+    return reads / (time.perf_counter() - start)
+
+
+def _nowait_reads_per_sec(iv, duration=1.0):
+    reads = 0
+    start = time.perf_counter()
+    while (time.perf_counter() - start) < duration:
+        for i in range(100):
+            iv.value_nowait
+        reads += 100
+    return reads / (time.perf_counter() - start)
+
+
+def main():
+    node = IsacNode('bench')
+    try:
+        policies = [
+            ('always (default)', AlwaysYield()),
+            ('every 100 reads', YieldEvery(100)),
+            ('time sliced 10ms', YieldTimeSliced(0.01)),
+            ('never', NeverYield()),
+        ]
+        for name, policy in policies:
+            iv = IsacValue(
+                node, 'bench://value_reads/' + name, 0, yield_policy=policy,
+                survey_last_value=False, survey_static_tags=False
+            )
+            print('%-20s %12.0f reads/s' % (name, _reads_per_sec(iv)))
+
+        print('%-20s %12.0f reads/s' % ('value_nowait', _nowait_reads_per_sec(iv)))
+    finally:
+        node.shutdown()
+
+
+if __name__ == '__main__':
+    main()
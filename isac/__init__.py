@@ -12,4 +12,5 @@
 from . import patch  # noqa: F401
 
 from .isac_node import IsacNode  # noqa: F401
+from .publish_policy import PublishPolicy  # noqa: F401
 from .isac_value import IsacValue, ArchivedValue, NoPeerWithHistoryException  # noqa: F401
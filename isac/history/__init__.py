@@ -0,0 +1,23 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+
+# Third-party imports
+
+# Local imports
+from .aggregation import aggregate, AGGREGATES, DEFAULT_AGGREGATES  # noqa: F401
+from .codec import encode_block, decode_block  # noqa: F401
+from .columnar import pack_columns, unpack_columns  # noqa: F401
+from .retention import Retention, RetentionPolicy  # noqa: F401
+from .export import (  # noqa: F401
+    ColumnarFileWriter, ColumnarFileReader, export_store, export_path
+)
+from .query import query_options, decode_result, merge_streams  # noqa: F401
+from .store import HistoryStore  # noqa: F401
+from .ring_buffer import RingBufferStore  # noqa: F401
+from .segment_store import SegmentStore  # noqa: F401
+from .tiered_store import TieredStore  # noqa: F401
@@ -0,0 +1,128 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import math
+from array import array
+from bisect import bisect_left
+
+# Third-party imports
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Local imports
+from ..tools.values import is_number
+
+AGGREGATES = ('min', 'max', 'mean', 'sum', 'count', 'first', 'last')
+NUMERIC_AGGREGATES = ('min', 'max', 'mean', 'sum')
+DEFAULT_AGGREGATES = ('min', 'max', 'mean', 'last', 'count')
+
+
+def check_functions(functions):
+    unknown = [name for name in functions if name not in AGGREGATES]
+    if unknown:
+        raise ValueError('Unknown aggregate functions: %s' % ', '.join(unknown))
+
+
+def aggregate(timestamps, values, bucket, functions=DEFAULT_AGGREGATES):
+    """ Reduce time ordered columns into buckets of bucket seconds
+
+    Buckets are aligned on the epoch so that consecutive queries line up.
+    Returns a [bucket_start, {function: result}] list of the non-empty buckets.
+    Numeric functions give None for buckets holding non-numeric values.
+    """
+    if not bucket > 0:
+        raise ValueError('bucket should be a positive number of seconds')
+    check_functions(functions)
+
+    if not len(timestamps):
+        return []
+
+    if not isinstance(values, array) and all(map(is_number, values)):
+        values = array('d', values)
+
+    if numpy is not None:
+        return _aggregate_numpy(timestamps, values, bucket, functions)
+    return _aggregate_python(timestamps, values, bucket, functions)
+
+
+def _aggregate_numpy(timestamps, values, bucket, functions):
+    ts = numpy.asarray(timestamps, dtype=float)
+    keys = numpy.floor(ts / bucket)
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(keys)) + 1))
+    ends = numpy.append(starts[1:], len(ts))
+
+    numeric = isinstance(values, array)
+    if numeric:
+        values = numpy.frombuffer(values, dtype=float)
+
+    columns = {}
+    for name in functions:
+        if name == 'count':
+            columns[name] = (ends - starts).tolist()
+        elif name == 'first':
+            columns[name] = [values[i] for i in starts.tolist()]
+        elif name == 'last':
+            columns[name] = [values[i - 1] for i in ends.tolist()]
+        elif not numeric:
+            columns[name] = [None] * len(starts)
+        elif name == 'min':
+            columns[name] = numpy.minimum.reduceat(values, starts).tolist()
+        elif name == 'max':
+            columns[name] = numpy.maximum.reduceat(values, starts).tolist()
+        elif name == 'sum':
+            columns[name] = numpy.add.reduceat(values, starts).tolist()
+        elif name == 'mean':
+            columns[name] = (numpy.add.reduceat(values, starts) / (ends - starts)).tolist()
+
+    if numeric:
+        # Plain floats rather than numpy scalars, the result goes through JSON
+        for name in ('first', 'last'):
+            if name in columns:
+                columns[name] = [float(value) for value in columns[name]]
+
+    bucket_starts = (keys[starts] * bucket).tolist()
+    return [
+        [bucket_start, {name: columns[name][i] for name in functions}]
+        for i, bucket_start in enumerate(bucket_starts)
+    ]
+
+
+def _aggregate_python(timestamps, values, bucket, functions):
+    numeric = isinstance(values, array)
+    result = []
+    count = len(timestamps)
+    i = 0
+    while i < count:
+        key = math.floor(timestamps[i] / bucket)
+        # A bucket always holds at least one point, even with rounding at its edge
+        j = max(i + 1, bisect_left(timestamps, (key + 1) * bucket, i, count))
+        chunk = values[i:j]
+
+        aggregates = {}
+        for name in functions:
+            if name == 'count':
+                aggregates[name] = j - i
+            elif name == 'first':
+                aggregates[name] = chunk[0]
+            elif name == 'last':
+                aggregates[name] = chunk[-1]
+            elif not numeric:
+                aggregates[name] = None
+            elif name == 'min':
+                aggregates[name] = min(chunk)
+            elif name == 'max':
+                aggregates[name] = max(chunk)
+            elif name == 'sum':
+                aggregates[name] = math.fsum(chunk)
+            elif name == 'mean':
+                aggregates[name] = math.fsum(chunk) / (j - i)
+
+        result.append([key * bucket, aggregates])
+        i = j
+    return result
@@ -0,0 +1,219 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import struct
+import zlib
+from array import array
+
+# Third-party imports
+
+# Local imports
+from .columnar import sparse_tags
+
+# Compressed block layout:
+#   header: magic, flags, point count
+#   then three sections, each prefixed by its byte length:
+#     timestamps: delta-of-delta of the 64 bits patterns of the timestamps
+#     values: XOR of consecutive 64 bits patterns of the values when all numeric,
+#             zlib compressed JSON list otherwise
+#     tags: zlib compressed JSON list of [index, tags] pairs where tags change
+# Working on the bits of the doubles keeps the encoding lossless. As the bits of
+# positive doubles sort like the doubles, regular timestamps give small deltas of deltas.
+MAGIC = b'ISG1'
+FLAG_NUMERIC = 0x01
+_HEADER = struct.Struct('<4sBI')
+_LENGTH = struct.Struct('<I')
+
+_MASK64 = (1 << 64) - 1
+
+# Delta-of-delta buckets: (prefix, bits) for dod in [-2**(bits-1), 2**(bits-1))
+_DOD_BUCKETS = (('10', 7), ('110', 12), ('1110', 20), ('11110', 32))
+_DOD_FALLBACK = ('11111', 66)
+
+
+def encode_block(timestamps, values, tags):
+    """ Compress time ordered columns into one block of bytes
+    """
+    count = len(timestamps)
+    numeric = isinstance(values, array)
+    sections = [
+        _encode_timestamps(_to_bits(timestamps, 'q')) if count else b'',
+        _encode_values(_to_bits(values, 'Q')) if (numeric and count) else b'',
+        zlib.compress(json.dumps(sparse_tags(tags)).encode()),
+    ]
+    if not numeric:
+        sections[1] = zlib.compress(json.dumps(list(values)).encode())
+
+    flags = FLAG_NUMERIC if numeric else 0
+    return b''.join(
+        [_HEADER.pack(MAGIC, flags, count)] +
+        [_LENGTH.pack(len(section)) + section for section in sections]
+    )
+
+
+def decode_block(data):
+    """ (timestamps, values, sparse tags) of a compressed block
+
+    Timestamps are an array('d'), and so are values if they were all floats.
+    """
+    magic, flags, count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a compressed history block')
+
+    sections = []
+    offset = _HEADER.size
+    for i in range(3):
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        sections.append(data[offset:offset + length])
+        offset += length
+
+    timestamps = _from_bits(_decode_timestamps(sections[0], count), 'q')
+    if flags & FLAG_NUMERIC:
+        values = _from_bits(_decode_values(sections[1], count), 'Q')
+    else:
+        values = json.loads(zlib.decompress(sections[1]))
+    tags = [(index, point_tags) for index, point_tags in json.loads(zlib.decompress(sections[2]))]
+    return timestamps, values, tags
+
+
+def _to_bits(column, typecode):
+    bits = array(typecode)
+    bits.frombytes(array('d', column).tobytes())
+    return bits
+
+
+def _from_bits(bits, typecode):
+    column = array('d')
+    if bits:
+        column.frombytes(array(typecode, bits).tobytes())
+    return column
+
+
+def _to_bytes(chunks):
+    bits = ''.join(chunks)
+    padding = -len(bits) % 8
+    return int(bits + '0' * padding, 2).to_bytes((len(bits) + padding) // 8, 'big')
+
+
+def _to_bit_string(data):
+    return format(int.from_bytes(data, 'big'), '0%db' % (len(data) * 8)) if data else ''
+
+
+def _encode_timestamps(bits):
+    chunks = [format(bits[0] & _MASK64, '064b')]
+    prev = bits[0]
+    prev_delta = 0
+    for cur in bits[1:]:
+        delta = cur - prev
+        dod = delta - prev_delta
+        prev, prev_delta = cur, delta
+
+        if dod == 0:
+            chunks.append('0')
+            continue
+        for prefix, width in _DOD_BUCKETS:
+            if -(1 << (width - 1)) <= dod < (1 << (width - 1)):
+                break
+        else:
+            prefix, width = _DOD_FALLBACK
+        chunks.append(prefix + format(dod & ((1 << width) - 1), '0%db' % width))
+
+    return _to_bytes(chunks)
+
+
+def _decode_timestamps(data, count):
+    if not count:
+        return []
+
+    bits = _to_bit_string(data)
+    prev = int(bits[:64], 2)
+    if prev >= (1 << 63):
+        prev -= 1 << 64
+    result = [prev]
+    prev_delta = 0
+    pos = 64
+    widths = dict(_DOD_BUCKETS + (_DOD_FALLBACK,))
+
+    for i in range(count - 1):
+        if bits[pos] == '0':
+            pos += 1
+            dod = 0
+        else:
+            end = bits.find('0', pos, pos + 5)
+            prefix = bits[pos:pos + 5] if end < 0 else bits[pos:end + 1]
+            width = widths[prefix]
+            pos += len(prefix)
+            dod = int(bits[pos:pos + width], 2)
+            if dod >= (1 << (width - 1)):
+                dod -= 1 << width
+            pos += width
+
+        prev_delta += dod
+        prev += prev_delta
+        result.append(prev)
+
+    return result
+
+
+def _encode_values(bits):
+    chunks = [format(bits[0], '064b')]
+    prev = bits[0]
+    prev_lead = prev_trail = None
+    for cur in bits[1:]:
+        xor = cur ^ prev
+        prev = cur
+
+        if xor == 0:
+            chunks.append('0')
+            continue
+
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if (prev_lead is not None) and (lead >= prev_lead) and (trail >= prev_trail):
+            # Meaningful bits fit in the previous window
+            width = 64 - prev_lead - prev_trail
+            chunks.append('10' + format(xor >> prev_trail, '0%db' % width))
+        else:
+            width = 64 - lead - trail
+            chunks.append('11' + format(lead, '05b') + format(width - 1, '06b') +
+                          format(xor >> trail, '0%db' % width))
+            prev_lead, prev_trail = lead, trail
+
+    return _to_bytes(chunks)
+
+
+def _decode_values(data, count):
+    if not count:
+        return []
+
+    bits = _to_bit_string(data)
+    prev = int(bits[:64], 2)
+    result = [prev]
+    pos = 64
+    lead = trail = width = 0
+
+    for i in range(count - 1):
+        if bits[pos] == '0':
+            pos += 1
+            result.append(prev)
+            continue
+
+        if bits[pos + 1] == '1':
+            lead = int(bits[pos + 2:pos + 7], 2)
+            width = int(bits[pos + 7:pos + 13], 2) + 1
+            trail = 64 - lead - width
+            pos += 13
+        else:
+            pos += 2
+
+        prev ^= int(bits[pos:pos + width], 2) << trail
+        pos += width
+        result.append(prev)
+
+    return result
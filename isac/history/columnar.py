@@ -0,0 +1,93 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import sys
+from array import array
+from base64 import b64decode, b64encode
+
+# Third-party imports
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Local imports
+
+
+def pack_columns(timestamps, values, tags):
+    """ Wire form of history columns
+
+    Numeric columns are sent as base64 little-endian doubles. Tags are only sent
+    where they change, as [index, tags] pairs.
+    """
+    return {
+        'ts': _pack_doubles(timestamps),
+        'values': _pack_doubles(values) if isinstance(values, array) else values,
+        'tags': sparse_tags(tags),
+    }
+
+
+def sparse_tags(tags):
+    # [index, tags] pairs of the points where tags change
+    sparse = []
+    last_tags = None
+    for index, point_tags in enumerate(tags):
+        if (index == 0) or (point_tags != last_tags):
+            sparse.append([index, point_tags])
+            last_tags = point_tags
+    return sparse
+
+
+def expand_tags(sparse, count):
+    # Back to one tags entry per point, points sharing the same tags object
+    tags = []
+    for (index, point_tags), (next_index, _) in zip(sparse, sparse[1:] + [(count, None)]):
+        tags.extend([point_tags] * (next_index - index))
+    return tags
+
+
+def unpack_columns(packed):
+    """ Timestamps and values arrays (numpy ones when available) and sparse tags
+
+    Each (index, tags) pair of the tags list holds the tags of the points from
+    index up to the index of the next pair.
+    """
+    values = packed['values']
+    if not isinstance(values, list):
+        values = _unpack_doubles(values)
+    tags = [(index, point_tags) for index, point_tags in packed['tags']]
+    return _unpack_doubles(packed['ts']), values, tags
+
+
+def as_array(column):
+    # Writable numpy view of an array('d') column when numpy is available, sharing its memory
+    if numpy is not None:
+        if not isinstance(column, array):
+            column = array('d', column)
+        return numpy.frombuffer(column, dtype=float)
+    return column
+
+
+def _pack_doubles(column):
+    if (not isinstance(column, array)) or (sys.byteorder == 'big'):
+        column = array('d', column)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return b64encode(column.tobytes()).decode()
+
+
+def _unpack_doubles(data):
+    data = b64decode(data)
+    if numpy is not None:
+        # bytearray keeps the array writable, as the array('d') fallback is
+        return numpy.frombuffer(bytearray(data), dtype='<f8')
+
+    column = array('d')
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
@@ -0,0 +1,195 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import logging
+import os
+import struct
+import sys
+import zlib
+from array import array
+from urllib.parse import quote
+
+# Third-party imports
+
+# Local imports
+from ..tools.values import is_double
+from .columnar import sparse_tags, expand_tags
+
+logger = logging.getLogger(__name__)
+
+# Columnar export file layout:
+#   header: magic, length of the JSON file metadata, JSON file metadata
+#   blocks: header (point count, first ts, last ts, flags)
+#           then one zlib compressed column per field, each prefixed by its byte length:
+#             timestamps: little-endian doubles
+#             values: little-endian doubles when all numeric, JSON list otherwise
+#             tags: JSON list of [index, tags] pairs where tags change
+MAGIC = b'ISACCOL1'
+EXTENSION = '.isaccol'
+FLAG_NUMERIC = 0x01
+_FILE_HEADER = struct.Struct('<8sI')
+_BLOCK_HEADER = struct.Struct('<IddB')
+_LENGTH = struct.Struct('<I')
+
+
+class ColumnarFileWriter(object):
+    """ Writes history points into a compressed columnar file, block by block
+
+    Points are buffered until block_points of them are there, only one block is
+    ever held in memory. The file only appears under its name once closed.
+    """
+
+    def __init__(self, path, metadata=None, block_points=65536, level=6):
+        self.path = path
+        self.block_points = block_points
+        self.level = level
+        self.points = 0
+        self.blocks = 0
+
+        self._tmp_path = path + '.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        metadata = json.dumps(metadata or {}).encode()
+        self._file.write(_FILE_HEADER.pack(MAGIC, len(metadata)) + metadata)
+        self._reset()
+
+    def _reset(self):
+        self._timestamps = array('d')
+        self._values = array('d')
+        self._tags = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, ts, value, tags):
+        if isinstance(self._values, array) and not is_double(value):
+            self._values = self._values.tolist()
+        self._timestamps.append(ts)
+        self._values.append(value)
+        self._tags.append(tags)
+        if len(self._timestamps) >= self.block_points:
+            self.flush()
+
+    def extend(self, points):
+        for value, ts, tags in points:
+            self.append(ts, value, tags)
+
+    def flush(self):
+        count = len(self._timestamps)
+        if not count:
+            return
+
+        numeric = isinstance(self._values, array)
+        columns = [
+            _doubles(self._timestamps),
+            _doubles(self._values) if numeric else json.dumps(self._values).encode(),
+            json.dumps(sparse_tags(self._tags)).encode(),
+        ]
+        header = _BLOCK_HEADER.pack(
+            count, self._timestamps[0], self._timestamps[-1], FLAG_NUMERIC if numeric else 0)
+
+        self._file.write(header)
+        for column in columns:
+            column = zlib.compress(column, self.level)
+            self._file.write(_LENGTH.pack(len(column)) + column)
+        self._file.flush()
+
+        self.points += count
+        self.blocks += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class ColumnarFileReader(object):
+    """ Reads back the blocks of a columnar export file one at a time
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, length = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a columnar history file' % path)
+            self.metadata = json.loads(f.read(length))
+            self._data_offset = f.tell()
+
+    def iter_blocks(self):
+        # (timestamps, values, sparse tags) of every block
+        with open(self.path, 'rb') as f:
+            f.seek(self._data_offset)
+            while True:
+                header = f.read(_BLOCK_HEADER.size)
+                if len(header) < _BLOCK_HEADER.size:
+                    break
+                count, first_ts, last_ts, flags = _BLOCK_HEADER.unpack(header)
+
+                columns = []
+                for i in range(3):
+                    length = _LENGTH.unpack(f.read(_LENGTH.size))[0]
+                    columns.append(zlib.decompress(f.read(length)))
+
+                timestamps = _from_doubles(columns[0])
+                if flags & FLAG_NUMERIC:
+                    values = _from_doubles(columns[1])
+                else:
+                    values = json.loads(columns[1])
+                tags = [(index, tags) for index, tags in json.loads(columns[2])]
+                yield timestamps, values, tags
+
+    def __iter__(self):
+        for timestamps, values, tags in self.iter_blocks():
+            yield from zip(values, timestamps, expand_tags(tags, len(timestamps)))
+
+
+def export_store(store, path, t1, t2, metadata=None, block_points=65536, pause=None):
+    """ Stream the points of [t1, t2] of a history store into a columnar file
+
+    pause, when given, is called between blocks, e.g. to let other greenlets run.
+    """
+    with ColumnarFileWriter(path, metadata=metadata, block_points=block_points) as writer:
+        cursor = None
+        while True:
+            points, cursor = store.chunk(t1, t2, cursor, block_points)
+            writer.extend(points)
+            if cursor is None:
+                break
+            if pause is not None:
+                pause()
+    return writer.points
+
+
+def export_path(directory, uri):
+    return os.path.join(directory, quote(uri, safe='') + EXTENSION)
+
+
+def _doubles(column):
+    if sys.byteorder == 'big':
+        column = array('d', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_doubles(data):
+    column = array('d')
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
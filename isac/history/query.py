@@ -0,0 +1,76 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import heapq
+from array import array
+from base64 import b64decode
+from datetime import datetime, timedelta
+from itertools import repeat
+
+# Third-party imports
+
+# Local imports
+from .aggregation import check_functions, DEFAULT_AGGREGATES
+from .codec import decode_block
+from .columnar import as_array, expand_tags, unpack_columns
+
+
+def query_options(bucket=None, aggregates=DEFAULT_AGGREGATES, columnar=False, compressed=False):
+    """ Keyword arguments of a get_history_impl call for these query options
+    """
+    if (columnar or compressed) and (bucket is not None):
+        raise ValueError('Aggregated history is only available as a list of buckets')
+
+    if columnar or compressed:
+        options = {'columnar': True} if columnar else {}
+        if compressed:
+            options['compressed'] = True
+        return options
+    if bucket is None:
+        return {}
+
+    if isinstance(bucket, timedelta):
+        bucket = bucket.total_seconds()
+    check_functions(aggregates)
+    return {'bucket': bucket, 'aggregates': list(aggregates)}
+
+
+def decode_result(data, options):
+    """ Client side form of a get_history_impl result
+    """
+    if options.get('compressed', False):
+        timestamps, values, tags = decode_block(b64decode(data))
+        if options.get('columnar', False):
+            if isinstance(values, array):
+                values = as_array(values)
+            return as_array(timestamps), values, tags
+        return [
+            (value, datetime.fromtimestamp(ts), point_tags)
+            for value, ts, point_tags in zip(values, timestamps, expand_tags(tags, len(timestamps)))
+        ]
+    if options.get('columnar', False):
+        return unpack_columns(data)
+    if 'bucket' in options:
+        return [(results, datetime.fromtimestamp(bucket_start), {})
+                for bucket_start, results in data]
+    return [(point[0], datetime.fromtimestamp(point[1]), point[2]) for point in data]
+
+
+def merge_streams(streams):
+    """ Merge time ordered streams of (value, ts, tags) points
+
+    Points sharing a timestamp are taken from the first stream reaching that
+    timestamp only, so that a point recorded by several archivers comes out once.
+    """
+    tagged = [zip(stream, repeat(index)) for index, stream in enumerate(streams)]
+    owner_ts = owner = None
+    for point, index in heapq.merge(*tagged, key=lambda item: item[0][1]):
+        if point[1] != owner_ts:
+            owner_ts, owner = point[1], index
+        elif index != owner:
+            continue
+        yield point
@@ -0,0 +1,52 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import re
+
+# Third-party imports
+
+# Local imports
+
+
+class Retention(object):
+    """ How long to keep the history of a value
+
+    Raw points are kept raw seconds, then folded into coarser tiers given as
+    (bucket, keep) pairs: one aggregated point per bucket seconds, kept keep
+    seconds. None keeps data forever.
+    e.g. Retention(raw=7 * 86400, tiers=[(60, 365 * 86400)])
+    """
+
+    def __init__(self, raw=None, tiers=()):
+        self.raw = raw
+        self.tiers = [tuple(tier) for tier in tiers]
+
+        buckets = [bucket for bucket, keep in self.tiers]
+        if any(bucket <= 0 for bucket in buckets) or (buckets != sorted(set(buckets))):
+            raise ValueError('Tier buckets should be positive and increasing')
+
+    def __repr__(self):
+        return 'Retention(raw=%r, tiers=%r)' % (self.raw, self.tiers)
+
+
+class RetentionPolicy(object):
+    """ Retention of the values whose URI matches a regular expression
+
+    Rules are (pattern, Retention) pairs, the first matching one applies.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = [(re.compile(pattern), retention) for pattern, retention in rules]
+
+    def add_rule(self, pattern, retention):
+        self.rules.append((re.compile(pattern), retention))
+
+    def for_uri(self, uri):
+        for pattern, retention in self.rules:
+            if pattern.search(uri):
+                return retention
+        return None
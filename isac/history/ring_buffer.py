@@ -0,0 +1,152 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Third-party imports
+
+# Local imports
+from ..tools.values import is_double
+from .store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+
+class RingBufferStore(HistoryStore):
+    """ Fixed capacity in-memory history, the oldest points get overwritten
+
+    Timestamps live in an array('d') column, and so do values as long as they are
+    all floats. The first other value turns the value column into a list.
+    Columns grow as points arrive, up to capacity, without limit when capacity is None.
+    Points older than the last stored one are dropped.
+    """
+
+    _MIN_SIZE = 16
+
+    def __init__(self, capacity=100000):
+        if (capacity is not None) and (capacity < 1):
+            raise ValueError('capacity should be at least 1')
+
+        self.capacity = capacity
+
+        self._ts = array('d')
+        self._values = array('d')
+        self._tags = []
+        self._numeric = True
+        self._last_tags = None
+
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def first_ts(self):
+        return self._ts[self._start] if self._count else None
+
+    @property
+    def last_ts(self):
+        return self._ts[(self._start + self._count - 1) % len(self._ts)] if self._count else None
+
+    def append(self, ts, value, tags):
+        if self._count and (ts < self.last_ts):
+            logger.debug('Dropping point older than the last one stored: %s', ts)
+            return False
+
+        if self._numeric and not is_double(value):
+            self._values = self._values.tolist()
+            self._numeric = False
+
+        # Consecutive points usually share the same tags, only keep one copy of them
+        if tags != self._last_tags:
+            self._last_tags = dict(tags) if tags is not None else None
+
+        if (self._count == len(self._ts)) and (
+                (self.capacity is None) or (self._count < self.capacity)):
+            self._grow()
+
+        size = len(self._ts)
+        if self._count < size:
+            index = (self._start + self._count) % size
+            self._count += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % size
+
+        self._ts[index] = ts
+        self._values[index] = value
+        self._tags[index] = self._last_tags
+        return True
+
+    def _grow(self):
+        # Double the columns, up to capacity, the ring starting back at index 0
+        size = len(self._ts)
+        new_size = max(2 * size, self._MIN_SIZE)
+        if self.capacity is not None:
+            new_size = min(self.capacity, new_size)
+        extra = new_size - size
+        start = self._start
+        self._ts = self._ts[start:] + self._ts[:start] + array('d', [0.0]) * extra
+        self._values = self._values[start:] + self._values[:start] + (
+            array('d', [0.0]) * extra if self._numeric else [0.0] * extra)
+        self._tags = self._tags[start:] + self._tags[:start] + [None] * extra
+        self._start = 0
+
+    def _segments(self):
+        # The ring seen as at most two sorted physical slices [lo, hi)
+        size = len(self._ts)
+        end = self._start + self._count
+        if end <= size:
+            return [(self._start, end)]
+        return [(self._start, size), (0, end - size)]
+
+    def _slices(self, t1, t2):
+        slices = []
+        for lo, hi in self._segments():
+            if (hi <= lo) or (self._ts[hi - 1] < t1) or (self._ts[lo] > t2):
+                continue
+            i1 = bisect_left(self._ts, t1, lo, hi)
+            i2 = bisect_right(self._ts, t2, lo, hi)
+            if i1 < i2:
+                slices.append((i1, i2))
+        return slices
+
+    def truncate(self, before):
+        dropped = 0
+        for lo, hi in self._segments():
+            dropped += bisect_left(self._ts, before, lo, hi) - lo
+        if dropped:
+            self._start = (self._start + dropped) % len(self._ts)
+            self._count -= dropped
+        return dropped
+
+    def count(self, t1, t2):
+        return sum(i2 - i1 for i1, i2 in self._slices(t1, t2))
+
+    def iter_range(self, t1, t2):
+        for i1, i2 in self._slices(t1, t2):
+            for i in range(i1, i2):
+                yield self._values[i], self._ts[i], self._tags[i]
+
+    def range(self, t1, t2):
+        points = []
+        for i1, i2 in self._slices(t1, t2):
+            points.extend(zip(self._values[i1:i2], self._ts[i1:i2], self._tags[i1:i2]))
+        return points
+
+    def columns(self, t1, t2):
+        timestamps = array('d')
+        values = array('d') if self._numeric else []
+        tags = []
+        for i1, i2 in self._slices(t1, t2):
+            timestamps.extend(self._ts[i1:i2])
+            values.extend(self._values[i1:i2])
+            tags.extend(self._tags[i1:i2])
+        return timestamps, values, tags
@@ -0,0 +1,450 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from urllib.parse import quote
+
+# Third-party imports
+
+# Local imports
+from ..tools.values import is_double
+from .codec import encode_block, decode_block
+from .columnar import expand_tags
+from .store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Segment file layout:
+#   header: magic (8 bytes) + reserved (8 bytes)
+#   records: ts (double), value (double), tags_ref (int64), value_ref (int64), crc32, padding
+# tags_ref/value_ref are offsets of a JSON line in the companion .aux file, -1 if none.
+# A value_ref of -1 means the value is the float one stored in the record.
+MAGIC = b'ISACSEG1'
+HEADER_SIZE = 16
+_RECORD = struct.Struct('<ddqqI4x')
+_RECORD_HEAD = struct.Struct('<ddqq')
+_RECORD_TAIL = struct.Struct('<I4x')
+RECORD_SIZE = _RECORD.size
+_TS = struct.Struct('<d')
+
+# Compressed (sealed) segment file layout:
+#   header: magic, first ts, last ts, point count
+#   then a block of isac.history.codec
+GOR_MAGIC = b'ISACGOR1'
+_GOR_HEADER = struct.Struct('<8sddI')
+
+
+class SegmentStore(HistoryStore):
+    """ Persistent append-only history, read back through mmap
+
+    Points are appended to fixed size records in segment files of at most
+    segment_points records each. Only the first and last timestamps of every
+    segment are read when opening, data is paged in by range queries.
+
+    With compress, full segments are rewritten with the delta-of-delta/XOR
+    encoding of isac.history.codec once sealed, and decoded when read.
+    """
+
+    def __init__(self, path, segment_points=65536, sync=False, compress=False):
+        self.path = path
+        self.segment_points = segment_points
+        self.sync = sync
+        self.compress = compress
+
+        os.makedirs(self.path, exist_ok=True)
+
+        # Per segment time index: [seq, first_ts, last_ts, count]
+        self._segments = []
+        self._compressed = set()
+        self._maps = {}
+        self._decoded = (None, None)
+        self._count = 0
+        self._first_ts = None
+        self._last_ts = None
+
+        self._seg_file = None
+        self._aux_file = None
+        self._last_tags = None
+        self._last_tags_ref = -1
+
+        self._load()
+
+    @classmethod
+    def for_uri(cls, root, uri, **kwargs):
+        return cls(os.path.join(root, quote(uri, safe='')), **kwargs)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def first_ts(self):
+        return self._first_ts
+
+    @property
+    def last_ts(self):
+        return self._last_ts
+
+    def _seg_path(self, seq):
+        return os.path.join(self.path, '%08d.seg' % seq)
+
+    def _aux_path(self, seq):
+        return os.path.join(self.path, '%08d.aux' % seq)
+
+    def _gor_path(self, seq):
+        return os.path.join(self.path, '%08d.gor' % seq)
+
+    # Opening
+
+    def _load(self):
+        names = os.listdir(self.path)
+        seqs = sorted(int(name[:-4]) for name in names if name.endswith('.seg'))
+        compressed = set(int(name[:-4]) for name in names if name.endswith('.gor'))
+
+        for seq in seqs:
+            if seq in compressed:
+                # Left over by a crash between compressing and removing a segment
+                self._remove_raw(seq)
+        seqs = sorted(set(seqs) - compressed)
+
+        self._load_compressed(sorted(compressed))
+        self._load_raw(seqs)
+
+        if not self._segments:
+            self._new_segment(0)
+        elif self._segments[-1][0] in self._compressed:
+            self._new_segment(self._segments[-1][0] + 1)
+        else:
+            self._open_active(self._segments[-1][0])
+
+        if self.compress:
+            # Segments sealed before compression was enabled, or before a crash
+            for segment in self._segments[:-1]:
+                if segment[3] and (segment[0] not in self._compressed):
+                    self._compress_segment(segment)
+
+    def _load_compressed(self, seqs):
+        # Only the headers of the compressed segments are read
+        for seq in seqs:
+            with open(self._gor_path(seq), 'rb') as f:
+                magic, first_ts, last_ts, count = _GOR_HEADER.unpack(f.read(_GOR_HEADER.size))
+            if magic != GOR_MAGIC:
+                logger.warning('Ignoring %s, not a compressed segment', self._gor_path(seq))
+                continue
+            self._segments.append([seq, first_ts, last_ts, count])
+            self._compressed.add(seq)
+        self._segments.sort()
+        for segment in self._segments:
+            self._count += segment[3]
+        if self._segments:
+            self._first_ts = self._segments[0][1]
+            self._last_ts = self._segments[-1][2]
+
+    def _load_raw(self, seqs):
+        # Raw segments come after the compressed ones, the last one is the active one
+        for seq in seqs:
+            count = self._recover(seq) if seq == seqs[-1] else self._records_in(seq)
+            if not count:
+                continue
+
+            with open(self._seg_path(seq), 'rb') as f:
+                f.seek(HEADER_SIZE)
+                first_ts = _TS.unpack(f.read(_TS.size))[0]
+                f.seek(HEADER_SIZE + (count - 1) * RECORD_SIZE)
+                last_ts = _TS.unpack(f.read(_TS.size))[0]
+            self._segments.append([seq, first_ts, last_ts, count])
+            self._count += count
+            if self._first_ts is None:
+                self._first_ts = first_ts
+            self._last_ts = last_ts
+
+        if seqs and (not self._segments or self._segments[-1][0] != seqs[-1]):
+            self._segments.append([seqs[-1], None, None, 0])
+
+    def _records_in(self, seq):
+        return max(0, os.path.getsize(self._seg_path(seq)) - HEADER_SIZE) // RECORD_SIZE
+
+    def _recover(self, seq):
+        # Drop a partially written or corrupted tail left by a crash
+        seg_path = self._seg_path(seq)
+        count = self._records_in(seq)
+        with open(seg_path, 'r+b') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                f.seek(0)
+                f.write(MAGIC + bytes(HEADER_SIZE - len(MAGIC)))
+                count = 0
+
+            while count:
+                f.seek(HEADER_SIZE + (count - 1) * RECORD_SIZE)
+                record = f.read(RECORD_SIZE)
+                head = record[:_RECORD_HEAD.size]
+                if zlib.crc32(head) == _RECORD_TAIL.unpack(record[_RECORD_HEAD.size:])[0]:
+                    break
+                logger.warning('Dropping corrupted record %d of %s', count - 1, seg_path)
+                count -= 1
+
+            f.truncate(HEADER_SIZE + count * RECORD_SIZE)
+        return count
+
+    def _open_active(self, seq):
+        self._seg_file = open(self._seg_path(seq), 'ab')
+        self._aux_file = open(self._aux_path(seq), 'ab')
+        self._last_tags = None
+        self._last_tags_ref = -1
+
+    def _new_segment(self, seq):
+        self._close_active()
+        with open(self._seg_path(seq), 'wb') as f:
+            f.write(MAGIC + bytes(HEADER_SIZE - len(MAGIC)))
+        self._segments.append([seq, None, None, 0])
+        self._open_active(seq)
+
+    def _close_active(self):
+        if self._seg_file is not None:
+            self._seg_file.close()
+            self._aux_file.close()
+            self._seg_file = self._aux_file = None
+
+    def _close_maps(self, seq):
+        seg_map, aux_map = self._maps.pop(seq)
+        seg_map.close()
+        if aux_map is not None:
+            aux_map.close()
+
+    def close(self):
+        self._close_active()
+        for seq in list(self._maps):
+            self._close_maps(seq)
+        self._decoded = (None, None)
+
+    # Writing
+
+    def _write_aux(self, data):
+        ref = self._aux_file.tell()
+        self._aux_file.write(json.dumps(data).encode() + b'\n')
+        return ref
+
+    def append(self, ts, value, tags):
+        if self._count and (ts < self._last_ts):
+            logger.debug('Dropping point older than the last one stored: %s', ts)
+            return False
+
+        active = self._segments[-1]
+        if active[3] >= self.segment_points:
+            self._new_segment(active[0] + 1)
+            if self.compress:
+                self._compress_segment(active)
+            active = self._segments[-1]
+
+        if tags != self._last_tags:
+            self._last_tags = dict(tags) if tags is not None else None
+            self._last_tags_ref = -1 if tags is None else self._write_aux(tags)
+
+        if is_double(value):
+            num_value, value_ref = value, -1
+        else:
+            num_value, value_ref = 0.0, self._write_aux(value)
+
+        # Aux data is flushed before the record pointing to it
+        self._aux_file.flush()
+        head = _RECORD_HEAD.pack(ts, num_value, self._last_tags_ref, value_ref)
+        self._seg_file.write(head + _RECORD_TAIL.pack(zlib.crc32(head)))
+        self._seg_file.flush()
+        if self.sync:
+            os.fsync(self._aux_file.fileno())
+            os.fsync(self._seg_file.fileno())
+
+        if active[3] == 0:
+            active[1] = ts
+        active[2] = ts
+        active[3] += 1
+
+        self._count += 1
+        if self._first_ts is None:
+            self._first_ts = ts
+        self._last_ts = ts
+        return True
+
+    def _compress_segment(self, segment):
+        seq, first_ts, last_ts, count = segment
+        block = encode_block(*self._segment_columns(seq, count, 0, count))
+
+        gor_path = self._gor_path(seq)
+        with open(gor_path + '.tmp', 'wb') as f:
+            f.write(_GOR_HEADER.pack(GOR_MAGIC, first_ts, last_ts, count))
+            f.write(block)
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(gor_path + '.tmp', gor_path)
+
+        self._compressed.add(seq)
+        if seq in self._maps:
+            self._close_maps(seq)
+        self._remove_raw(seq)
+        logger.debug('Compressed segment %s: %d points in %d bytes', gor_path, count, len(block))
+
+    def _remove_raw(self, seq):
+        for path in (self._seg_path(seq), self._aux_path(seq)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def truncate(self, before):
+        # Whole sealed segments only, the active one is kept
+        dropped = 0
+        while (len(self._segments) > 1) and (self._segments[0][2] < before):
+            seq, first_ts, last_ts, count = self._segments.pop(0)
+            if seq in self._maps:
+                self._close_maps(seq)
+            if self._decoded[0] == seq:
+                self._decoded = (None, None)
+            self._remove_raw(seq)
+            if seq in self._compressed:
+                os.remove(self._gor_path(seq))
+                self._compressed.discard(seq)
+            dropped += count
+
+        if dropped:
+            self._count -= dropped
+            self._first_ts = self._segments[0][1]
+        return dropped
+
+    # Reading
+
+    def _decode(self, seq):
+        # Only the last decoded segment is kept, range queries read them in order
+        if self._decoded[0] != seq:
+            with open(self._gor_path(seq), 'rb') as f:
+                data = f.read()
+            timestamps, values, tags = decode_block(memoryview(data)[_GOR_HEADER.size:])
+            self._decoded = (seq, (timestamps, values, expand_tags(tags, len(timestamps))))
+        return self._decoded[1]
+
+    def _map(self, seq, count, need_aux=False):
+        maps = self._maps.get(seq, None)
+        if (maps is None) or (len(maps[0]) < HEADER_SIZE + count * RECORD_SIZE):
+            if maps is not None:
+                maps[0].close()
+            with open(self._seg_path(seq), 'rb') as f:
+                seg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            maps = [seg_map, None if maps is None else maps[1]]
+            self._maps[seq] = maps
+
+        if need_aux:
+            # The aux file of the active segment keeps growing
+            aux_size = os.path.getsize(self._aux_path(seq))
+            if aux_size and ((maps[1] is None) or (len(maps[1]) < aux_size)):
+                if maps[1] is not None:
+                    maps[1].close()
+                with open(self._aux_path(seq), 'rb') as f:
+                    maps[1] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return maps
+
+    def _bisect(self, seg_map, count, ts, right):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_ts = _TS.unpack_from(seg_map, HEADER_SIZE + mid * RECORD_SIZE)[0]
+            if (mid_ts < ts) or (right and mid_ts == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slices(self, t1, t2):
+        # (seq, first record, last record + 1) of every segment overlapping [t1, t2]
+        segments = [segment for segment in self._segments if segment[3]]
+        firsts = [segment[1] for segment in segments]
+        start = max(0, bisect_right(firsts, t1) - 1)
+        stop = bisect_right(firsts, t2)
+
+        for seq, first_ts, last_ts, count in segments[start:stop]:
+            if last_ts < t1:
+                continue
+            if seq in self._compressed:
+                timestamps = self._decode(seq)[0]
+                i1 = 0 if first_ts >= t1 else bisect_left(timestamps, t1)
+                i2 = count if last_ts <= t2 else bisect_right(timestamps, t2)
+            else:
+                seg_map = self._map(seq, count)[0]
+                i1 = 0 if first_ts >= t1 else self._bisect(seg_map, count, t1, False)
+                i2 = count if last_ts <= t2 else self._bisect(seg_map, count, t2, True)
+            if i1 < i2:
+                yield seq, count, i1, i2
+
+    def count(self, t1, t2):
+        return sum(i2 - i1 for seq, count, i1, i2 in self._slices(t1, t2))
+
+    def _records(self, seq, count, i1, i2):
+        seg_map = self._map(seq, count)[0]
+        return _RECORD.iter_unpack(
+            seg_map[HEADER_SIZE + i1 * RECORD_SIZE:HEADER_SIZE + i2 * RECORD_SIZE])
+
+    def _read_aux(self, aux_map, ref, cache):
+        if ref < 0:
+            return None
+        if ref not in cache:
+            end = aux_map.find(b'\n', ref)
+            cache[ref] = json.loads(aux_map[ref:end])
+        return cache[ref]
+
+    def iter_range(self, t1, t2):
+        for seq, count, i1, i2 in self._slices(t1, t2):
+            if seq in self._compressed:
+                timestamps, values, tags = self._decode(seq)
+                yield from zip(values[i1:i2], timestamps[i1:i2], tags[i1:i2])
+                continue
+
+            aux_map = self._map(seq, count, need_aux=True)[1]
+            tags_cache = {}
+            for ts, num_value, tags_ref, value_ref, crc in self._records(seq, count, i1, i2):
+                if value_ref < 0:
+                    value = num_value
+                else:
+                    value = self._read_aux(aux_map, value_ref, {})
+                yield value, ts, self._read_aux(aux_map, tags_ref, tags_cache)
+
+    def _segment_columns(self, seq, count, i1, i2):
+        if seq in self._compressed:
+            timestamps, values, tags = self._decode(seq)
+            return timestamps[i1:i2], values[i1:i2], tags[i1:i2]
+
+        timestamps = array('d')
+        values = array('d')
+        tags = []
+        aux_map = self._map(seq, count, need_aux=True)[1]
+        tags_cache = {}
+        for ts, num_value, tags_ref, value_ref, crc in self._records(seq, count, i1, i2):
+            timestamps.append(ts)
+            if value_ref < 0:
+                values.append(num_value)
+            else:
+                if isinstance(values, array):
+                    values = values.tolist()
+                values.append(self._read_aux(aux_map, value_ref, {}))
+            tags.append(self._read_aux(aux_map, tags_ref, tags_cache))
+        return timestamps, values, tags
+
+    def columns(self, t1, t2):
+        timestamps = array('d')
+        values = array('d')
+        tags = []
+        for seq, count, i1, i2 in self._slices(t1, t2):
+            segment_timestamps, segment_values, segment_tags = self._segment_columns(
+                seq, count, i1, i2)
+            if isinstance(values, array) and not isinstance(segment_values, array):
+                values = values.tolist()
+            timestamps.extend(segment_timestamps)
+            values.extend(segment_values)
+            tags.extend(segment_tags)
+        return timestamps, values, tags
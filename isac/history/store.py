@@ -0,0 +1,69 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+from itertools import islice
+
+# Third-party imports
+
+# Local imports
+from .aggregation import aggregate, DEFAULT_AGGREGATES
+
+
+class HistoryStore(object):
+    """ Time ordered storage of (value, timestamp, tags) points of one value
+    """
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def append(self, ts, value, tags):
+        raise NotImplementedError()
+
+    def iter_range(self, t1, t2):
+        raise NotImplementedError()
+
+    def truncate(self, before):
+        # Drop points older than before, returns how many were dropped
+        raise NotImplementedError()
+
+    def range(self, t1, t2):
+        return list(self.iter_range(t1, t2))
+
+    def columns(self, t1, t2):
+        timestamps, values, tags = [], [], []
+        for value, ts, point_tags in self.iter_range(t1, t2):
+            timestamps.append(ts)
+            values.append(value)
+            tags.append(point_tags)
+        return timestamps, values, tags
+
+    def aggregate(self, t1, t2, bucket, functions=DEFAULT_AGGREGATES):
+        timestamps, values, tags = self.columns(t1, t2)
+        return aggregate(timestamps, values, bucket, functions)
+
+    def chunk(self, t1, t2, cursor=None, max_points=10000):
+        """ Read at most max_points of [t1, t2] starting at cursor
+
+        Returns the points and the cursor of the next chunk, None once the end of
+        the period is reached. A cursor is a (ts, skip) pair, skip being the number of
+        points at ts already read, so that it stays valid while points get appended
+        or dropped between two calls.
+        """
+        start, skip = (t1, 0) if cursor is None else cursor
+        points = list(islice(self.iter_range(start, t2), skip, skip + max_points))
+        if len(points) < max_points:
+            return points, None
+
+        last_ts = points[-1][1]
+        same = 0
+        for point in reversed(points):
+            if point[1] != last_ts:
+                break
+            same += 1
+        if last_ts == start:
+            same += skip
+        return points, (last_ts, same)
@@ -0,0 +1,242 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging
+import math
+import operator
+import os
+import time
+from urllib.parse import quote
+
+# Third-party imports
+
+# Local imports
+from .aggregation import aggregate, check_functions, DEFAULT_AGGREGATES
+from .ring_buffer import RingBufferStore
+from .segment_store import SegmentStore
+from .store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+_PARTIALS = ('min', 'max', 'sum', 'count', 'first', 'last')
+
+
+class TieredStore(HistoryStore):
+    """ Raw history plus coarser aggregated tiers, following a Retention
+
+    compact() folds the complete buckets of every tier into the next one and
+    drops what is older than the retention. Aggregated points are stored as
+    (mean, bucket_start, {'aggregate': {min, max, sum, count, first, last}}),
+    the mean being the last value for non-numeric values.
+
+    Queries read the tier best suited to the period and resolution asked, topped up
+    with the raw points not compacted yet.
+
+    Default in-memory tiers have no capacity limit: a ring overwriting its oldest
+    aggregates would break the retention, or lose them before they are folded into
+    the next tier. They are kept to their retention by compact(). capacity only
+    applies to the raw points.
+    """
+
+    def __init__(self, retention, raw=None, tiers=None, capacity=100000):
+        self.retention = retention
+        self.raw = RingBufferStore(capacity) if raw is None else raw
+        if tiers is None:
+            tiers = [RingBufferStore(None) for tier in retention.tiers]
+        if len(tiers) != len(retention.tiers):
+            raise ValueError('One store is needed per retention tier')
+        self.tiers = tiers
+
+    @classmethod
+    def for_uri(cls, root, uri, retention, **kwargs):
+        # Persistent tiers, one SegmentStore directory per tier
+        path = os.path.join(root, quote(uri, safe=''))
+        return cls(
+            retention,
+            raw=SegmentStore(os.path.join(path, 'raw'), **kwargs),
+            tiers=[
+                SegmentStore(os.path.join(path, '%g' % bucket), **kwargs)
+                for bucket, keep in retention.tiers
+            ]
+        )
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def first_ts(self):
+        first = [store.first_ts for store in self._stores() if store.first_ts is not None]
+        return min(first) if first else None
+
+    @property
+    def last_ts(self):
+        return self.raw.last_ts
+
+    def _stores(self):
+        return [self.raw] + list(self.tiers)
+
+    def append(self, ts, value, tags):
+        return self.raw.append(ts, value, tags)
+
+    def close(self):
+        for store in self._stores():
+            if hasattr(store, 'close'):
+                store.close()
+
+    # Compaction
+
+    def compact(self, now=None):
+        if now is None:
+            now = time.time()
+
+        for index in range(len(self.tiers)):
+            self._compact_tier(index, now)
+
+        # Data is only dropped once folded into the next tier
+        stores = self._stores()
+        keeps = [self.retention.raw] + [keep for bucket, keep in self.retention.tiers]
+        for index, (store, keep) in enumerate(zip(stores, keeps)):
+            if keep is None:
+                continue
+            before = now - keep
+            if index < len(self.tiers):
+                next_last_ts = self.tiers[index].last_ts
+                if next_last_ts is None:
+                    continue
+                before = min(before, next_last_ts + self.retention.tiers[index][0])
+            dropped = store.truncate(before)
+            if dropped:
+                logger.debug('Dropped %d points older than %s', dropped, before)
+
+    def _compact_tier(self, index, now):
+        bucket = self.retention.tiers[index][0]
+        store = self.tiers[index]
+        source = self.raw if index == 0 else self.tiers[index - 1]
+
+        if store.last_ts is None:
+            if source.first_ts is None:
+                return
+            start = math.floor(source.first_ts / bucket) * bucket
+        else:
+            start = store.last_ts + bucket
+
+        # Complete buckets only
+        end = math.floor(now / bucket) * bucket
+        if start >= end:
+            return
+
+        for bucket_start, partial in _partials(source, index > 0, start, end, bucket):
+            if bucket_start >= end:
+                break
+            store.append(bucket_start, _point_value(partial), {'aggregate': partial})
+
+    # Queries
+
+    def _plan(self, t1, t2, resolution):
+        # [(store, t1, t2, aggregated)] pieces covering the period
+        stores = [(0, self.raw)] + [
+            (bucket, store) for (bucket, keep), store in zip(self.retention.tiers, self.tiers)]
+        eligible = [entry for entry in stores if entry[0] <= resolution]
+        others = [entry for entry in stores if entry[0] > resolution]
+
+        # The coarsest tier fine enough reaching t1, else the finest one reaching it,
+        # else the one with the oldest data
+        for bucket, store in list(reversed(eligible)) + others:
+            if (store.first_ts is not None) and (store.first_ts <= t1):
+                break
+        else:
+            non_empty = [entry for entry in stores if entry[1].first_ts is not None]
+            if not non_empty:
+                return []
+            bucket, store = min(non_empty, key=lambda entry: entry[1].first_ts)
+
+        if store is self.raw:
+            return [(self.raw, t1, t2, False)]
+
+        pieces = [(store, t1, min(t2, store.last_ts), True)]
+        folded = store.last_ts + bucket
+        if folded <= t2:
+            pieces.append((self.raw, max(t1, folded), t2, False))
+        return pieces
+
+    def iter_range(self, t1, t2):
+        for store, piece_t1, piece_t2, aggregated in self._plan(t1, t2, 0):
+            yield from store.iter_range(piece_t1, piece_t2)
+
+    def columns(self, t1, t2):
+        pieces = self._plan(t1, t2, 0)
+        if len(pieces) == 1:
+            store, piece_t1, piece_t2, aggregated = pieces[0]
+            return store.columns(piece_t1, piece_t2)
+        return super(TieredStore, self).columns(t1, t2)
+
+    def count(self, t1, t2):
+        return sum(
+            store.count(piece_t1, piece_t2) for store, piece_t1, piece_t2, aggregated
+            in self._plan(t1, t2, 0)
+        )
+
+    def truncate(self, before):
+        return sum(store.truncate(before) for store in self._stores())
+
+    def aggregate(self, t1, t2, bucket, functions=DEFAULT_AGGREGATES):
+        # Buckets of aggregated tiers are attributed whole to the query bucket they start in
+        check_functions(functions)
+        merged = []
+        for store, piece_t1, piece_t2, aggregated in self._plan(t1, t2, bucket):
+            for bucket_start, partial in _partials(store, aggregated, piece_t1, piece_t2, bucket):
+                if merged and (merged[-1][0] == bucket_start):
+                    merged[-1][1] = _merge(merged[-1][1], partial)
+                else:
+                    merged.append([bucket_start, partial])
+
+        return [
+            [bucket_start, {name: _result(partial, name) for name in functions}]
+            for bucket_start, partial in merged
+        ]
+
+
+def _partials(store, aggregated, t1, t2, bucket):
+    # [bucket_start, {min, max, sum, count, first, last}] of the points of a store
+    if not aggregated:
+        timestamps, values, tags = store.columns(t1, t2)
+        return aggregate(timestamps, values, bucket, _PARTIALS)
+
+    partials = []
+    for value, ts, tags in store.iter_range(t1, t2):
+        bucket_start = math.floor(ts / bucket) * bucket
+        partial = dict(tags['aggregate'])
+        if partials and (partials[-1][0] == bucket_start):
+            partials[-1][1] = _merge(partials[-1][1], partial)
+        else:
+            partials.append([bucket_start, partial])
+    return partials
+
+
+def _merge(partial, other):
+    def combine(func, a, b):
+        return None if (a is None) or (b is None) else func(a, b)
+
+    return {
+        'min': combine(min, partial['min'], other['min']),
+        'max': combine(max, partial['max'], other['max']),
+        'sum': combine(operator.add, partial['sum'], other['sum']),
+        'count': partial['count'] + other['count'],
+        'first': partial['first'],
+        'last': other['last'],
+    }
+
+
+def _result(partial, name):
+    if name == 'mean':
+        return None if partial['sum'] is None else partial['sum'] / partial['count']
+    return partial[name]
+
+
+def _point_value(partial):
+    mean = _result(partial, 'mean')
+    return partial['last'] if mean is None else mean
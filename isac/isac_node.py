@@ -6,28 +6,57 @@
 
 # System imports
 import logging
+import os
 import re
+from contextlib import contextmanager
+from functools import partial
 from weakref import WeakValueDictionary
 
 # Third-party imports
 
 # Local imports
-from isac.tools import green, zmq
-from isac.transport import PyreNode, ZmqRPC, ZmqPubSub
+from isac.tools import green, zmq, AlwaysYield, Future, TTLCache
+from isac.history import (
+    TieredStore, query_options, decode_result, export_store, export_path
+)
+from isac.isac_value import IsacValue, _to_ts_float
+from isac.transport import PyreNode, ZmqRPC, ZmqPubSub, DEFAULT_CODECS
 from isac.survey import SurveysManager
 from isac.event import EventsManager
 
 logger = logging.getLogger(__name__)
 
+# Procedures of archived values, called as <uri>.<procedure>
+_HISTORY_PROCEDURES = ('get_history_impl', 'get_history_chunk_impl')
+
+# Long running jobs (exports) always let the transport greenlets run between
+# steps, whatever the yield policy of property reads is
+_let_others_run = partial(green.sleep, 0)
+
 
 class IsacNode(object):
 
-    def __init__(self, name, context=zmq.Context.instance()):
+    def __init__(
+        self, name, context=zmq.Context.instance(), yield_policy=None,
+        last_value_cache_ttl=0, last_value_cache_size=10000,
+        retention=None, compaction_interval=60,
+        history_peer_cache_ttl=600, history_peer_cache_size=10000,
+        pub_codecs=DEFAULT_CODECS
+    ):
         self.isac_values = WeakValueDictionary()  # Should be a weakdict
+        self.yield_policy = AlwaysYield() if yield_policy is None else yield_policy
+        self.last_value_cache = TTLCache(last_value_cache_ttl, last_value_cache_size)
+        # URI -> name of the peer archiving it, dropped when that peer leaves or fails
+        self.history_peer_cache = TTLCache(history_peer_cache_ttl, history_peer_cache_size)
+        self.retention = retention
+        self.compaction_interval = compaction_interval
 
         self.rpc_regexp = re.compile('^rpc://(.*?)/(.*)$')
         self.rpc = ZmqRPC()
-        self.pub_sub = ZmqPubSub(context, self._sub_callback)
+        self.rpc.set_fallback(self._value_rpc)
+        self.rpc.register(self._get_history_many_impl, name='get_history_many_impl')
+        self.pub_sub = ZmqPubSub(context, self._sub_callback, codecs=pub_codecs)
+        self._batches = {}
 
         self.transport = PyreNode(name, context)
         try:
@@ -49,6 +78,7 @@ class IsacNode(object):
         self.pub_sub.start()
 
         self.transport.run()
+        self._compactor = green.spawn(self._compaction_loop)
 
         green.sleep(0.1)
 
@@ -66,6 +96,24 @@ class IsacNode(object):
         peer_name, func_name = self.rpc_regexp.match(uri).groups()
         return self.rpc.call_on(peer_name.encode(), func_name, *args, **kwargs)
 
+    def _value_rpc(self, name):
+        # Values are reachable over RPC by their URI without registering one procedure each,
+        # and so are the history procedures of archived values, <uri>.<procedure>
+        isac_value = self.isac_values.get(name, None)
+        if isac_value is not None:
+            return lambda: isac_value.snapshot()[:2]
+
+        uri, _, procedure = name.rpartition('.')
+        if procedure not in _HISTORY_PROCEDURES:
+            return None
+        archived_value = self.archived_value(uri)
+        return None if archived_value is None else getattr(archived_value, procedure)
+
+    def archived_value(self, uri):
+        # The value of uri if it is archived by this node
+        isac_value = self.isac_values.get(uri, None)
+        return isac_value if hasattr(isac_value, 'history') else None
+
     @property
     def name(self):
         return self.transport.name()
@@ -73,12 +121,46 @@ class IsacNode(object):
     def name_uuid(self):
         return {'peer_name': self.name, 'peer_uuid': str(self.transport.uuid())}
 
+    def publish(self, uri, data):
+        self._cache_last_value(uri, data)
+
+        batch = self._batches.get(green.getcurrent(), None)
+        if batch is None:
+            self.pub_sub.publish(uri, data)
+        else:
+            batch.append((uri, data))
+
+    @contextmanager
+    def batch(self):
+        # Updates published by the current greenlet are sent together when leaving the block
+        current = green.getcurrent()
+        if current in self._batches:  # Nested batch, the outer one will send
+            yield
+            return
+
+        self._batches[current] = []
+        try:
+            yield
+        finally:
+            batch = self._batches.pop(current)
+            if batch:
+                self.pub_sub.publish_many(batch)
+
+    def publish_many(self, updates):
+        with self.batch():
+            for isac_value, value in updates:
+                isac_value.value = value
+
     def subscribe(self, topic, isac_value):
         self.isac_values[topic] = isac_value
         self.pub_sub.subscribe(topic, isac_value)
 
+    def subscriptions(self):
+        return self.pub_sub.subscriptions()
+
     def _sub_callback(self, uri, data):
         logger.debug('(%s) Received update for %s: %s', self.name, uri, data)
+        self._cache_last_value(uri, data)
 
         if uri in self.isac_values:
             isac_value = self.isac_values[uri]
@@ -88,9 +170,26 @@ class IsacNode(object):
         return self.surveys_manager.call(
             'SurveyValueUri', match, timeout=timeout, limit_peers=limit_peers)
 
-    def survey_last_value(self, uri, timeout=0.5, limit_peers=3):
-        return self.surveys_manager.call(
+    def survey_last_value(self, uri, timeout=0.5, limit_peers=3, use_cache=True):
+        if use_cache and self.last_value_cache.enabled:
+            last_value = self.last_value_cache.get(uri)
+            if last_value is not None:
+                # Callers adopt the tags as theirs, the cached ones must stay untouched
+                value, ts_float, tags = last_value
+                return value, ts_float, dict(tags)
+
+        last_value = self.surveys_manager.call(
             'SurveyLastValue', uri, timeout=timeout, limit_peers=limit_peers)
+        self._cache_last_value(uri, last_value)
+        return last_value
+
+    def _cache_last_value(self, uri, data):
+        if not self.last_value_cache.enabled or not data[1]:
+            return
+
+        cached = self.last_value_cache.peek(uri)
+        if (cached is None) or (data[1] >= cached[1]):
+            self.last_value_cache.put(uri, (data[0], data[1], dict(data[2])))
 
     def survey_value_static_tags(self, uri, timeout=0.5, limit_peers=1):
         return self.surveys_manager.call(
@@ -104,9 +203,146 @@ class IsacNode(object):
         return self.surveys_manager.call(
             'SurveyValuesMetadata', uris, is_re=is_re, timeout=timeout, limit_peers=limit_peers)
 
-    def survey_value_history(self, uri, time_period, timeout=0.5, limit_peers=1):
-        return self.surveys_manager.call(
+    def survey_values_state(self, uris, timeout=0.5, limit_peers=0):
+        states = self.surveys_manager.call(
+            'SurveyValuesState', uris, timeout=timeout, limit_peers=limit_peers)
+        for uri, (last_value, static_tags) in states.items():
+            self._cache_last_value(uri, last_value)
+        return states
+
+    def create_values(self, uris, value_class=IsacValue, timeout=0.5, **kwargs):
+        # One survey round for all the values instead of two per value
+        uris = list(uris)
+        states = self.survey_values_state(uris, timeout=timeout)
+
+        isac_values = []
+        for uri in uris:
+            last_value, static_tags = states.get(uri, (None, None))
+            isac_value = value_class(
+                self, uri, static_tags=static_tags,
+                survey_last_value=False, survey_static_tags=False, **kwargs
+            )
+            if last_value:
+                isac_value.update_value_from_isac(*last_value)
+            isac_values.append(isac_value)
+
+        return isac_values
+
+    def survey_value_history(self, uri, time_period, timeout=0.5, limit_peers=1, use_cache=True):
+        if use_cache:
+            peer_name = self.history_peer_cache.get(uri)
+            if peer_name is not None:
+                return peer_name
+
+        peer_name = self.surveys_manager.call(
             'SurveyValueHistory', uri, time_period, timeout=timeout, limit_peers=limit_peers)
+        if peer_name:
+            self.history_peer_cache.put(uri, peer_name)
+        return peer_name
+
+    def forget_history_peer(self, uri):
+        # To call when the cached archiver of uri failed to answer
+        return self.history_peer_cache.pop(uri)
+
+    def survey_values_history(self, uris, time_period, timeout=0.5, limit_peers=0):
+        return self.surveys_manager.call(
+            'SurveyValuesHistory', uris, time_period, timeout=timeout, limit_peers=limit_peers)
+
+    def get_history_many(self, uris, time_period, timeout=0.5, **kwargs):
+        # One survey for all the values, then one concurrent request per archiving peer.
+        # Results are aligned with uris, None for values nobody archives.
+        options = query_options(**kwargs)
+        uris = list(uris)
+        t1, t2 = map(_to_ts_float, time_period)
+
+        # Values archived by this node are read directly
+        results = {
+            uri: decode_result(data, options)
+            for uri, data in self._get_history_many_impl(uris, (t1, t2), **options).items()
+        }
+        remote_uris = [uri for uri in uris if uri not in results]
+
+        # Known archivers are reused, only the others are surveyed
+        peer_uris = {}
+        unknown_uris = []
+        for uri in remote_uris:
+            peer_name = self.history_peer_cache.get(uri)
+            if peer_name is None:
+                unknown_uris.append(uri)
+            else:
+                peer_uris.setdefault(peer_name, []).append(uri)
+
+        if unknown_uris:
+            peers = self.survey_values_history(unknown_uris, (t1, t2), timeout=timeout)
+            for uri, peer_names in peers.items():
+                self.history_peer_cache.put(uri, peer_names[0])
+                peer_uris.setdefault(peer_names[0], []).append(uri)
+
+        requests = [
+            Future.spawn(
+                self.rpc.call_on, peer_name, 'get_history_many_impl', peer_uri_list, (t1, t2),
+                **options
+            )
+            for peer_name, peer_uri_list in peer_uris.items()
+        ]
+
+        for (peer_name, peer_uri_list), request in zip(peer_uris.items(), requests):
+            try:
+                data_by_uri = request.result()
+            except Exception:
+                for uri in peer_uri_list:
+                    self.forget_history_peer(uri)
+                raise
+            for uri, data in data_by_uri.items():
+                results[uri] = decode_result(data, options)
+
+        return [results.get(uri, None) for uri in uris]
+
+    def _get_history_many_impl(self, uris, time_period, **options):
+        results = {}
+        for uri in uris:
+            archived_value = self.archived_value(uri)
+            if archived_value is not None:
+                results[uri] = archived_value.get_history_impl(time_period, **options)
+        return results
+
+    def export_history(self, match, time_period, directory, block_points=65536):
+        # One columnar file per value archived by this node whose URI matches the
+        # regular expression, see isac.history.export. Returns the points exported per URI.
+        t1, t2 = map(_to_ts_float, time_period)
+        match_filter = re.compile(match)
+        os.makedirs(directory, exist_ok=True)
+
+        exported = {}
+        for uri in sorted(filter(match_filter.search, list(self.isac_values.keys()))):
+            history = getattr(self.isac_values.get(uri, None), 'history', None)
+            if history is None:
+                continue
+
+            exported[uri] = export_store(
+                history, export_path(directory, uri), t1, t2,
+                metadata={'uri': uri, 'time_period': [t1, t2]},
+                block_points=block_points, pause=_let_others_run
+            )
+            logger.debug('(%s) Exported %d points of %s', self.name, exported[uri], uri)
+
+        return exported
+
+    def compact_history(self, now=None):
+        # Apply retention to the history of the archived values having tiers
+        for isac_value in list(self.isac_values.values()):
+            history = getattr(isac_value, 'history', None)
+            if isinstance(history, TieredStore):
+                history.compact(now)
+                green.sleep(0)
+
+    def _compaction_loop(self):
+        while True:
+            green.sleep(self.compaction_interval)
+            try:
+                self.compact_history()
+            except Exception:
+                logger.exception('(%s) History compaction failed', self.name)
 
     def event_isac_value_entering(self, value_uri):
         self.events_manager.send('IsacValueEnteringEvent', value_uri)
@@ -128,12 +364,16 @@ class IsacNode(object):
 
     def _on_peer_gone(self, peer_id, peer_name):
         logger.debug('Peer gone: %s, %s', peer_name, peer_id)
-        # TODO: cleanup sub and rpc connections
+        self.history_peer_cache.evict(lambda uri, name: name == peer_name)
+        self.pub_sub.disconnect(peer_id, peer_name)
+        self.rpc.disconnect(peer_id, peer_name)
 
     def serve_forever(self):
         self.transport.task.join()
 
     def shutdown(self):
+        self._compactor.kill()
+
         logger.debug('Shutting down transport')
         self.transport.shutdown()
 
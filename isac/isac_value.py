@@ -7,43 +7,79 @@
 # System imports
 import logging
 import time
+import weakref
+from base64 import b64encode
+from functools import partial
 from datetime import datetime
+from types import MappingProxyType
 
 # Third-party imports
 
 # Local imports
-from isac.tools import green, Observable
+from isac.tools import Future, Observable
+from isac.transport import RPCError, RemoteRPCError
+from isac.publish_policy import PublishPolicy
+from isac.history import (
+    RingBufferStore, TieredStore, DEFAULT_AGGREGATES, encode_block, pack_columns, query_options,
+    decode_result, merge_streams
+)
 
 logger = logging.getLogger(__name__)
 
+# Shared by all values without tags, replaced by a real dict on first write
+_NO_TAGS = MappingProxyType({})
+
 
 class IsacValue(object):
 
+    __slots__ = (
+        'isac_node', 'uri', 'yield_policy', 'publish_policy', 'survey_future',
+        '_metadata', '_observers', '_metadata_observers',
+        '_static_tags', '_dynamic_tags', '_value', '_ts', '_timestamp', '__weakref__',
+    )
+
     def __init__(
         self, isac_node, uri, initial_value=None, static_tags=None, dynamic_tags=None,
-        metadata=None, observers=None, survey_last_value=True, survey_static_tags=True
+        metadata=None, observers=None, survey_last_value=True, survey_static_tags=True,
+        yield_policy=None, publish_policy=None, background_survey=False
     ):
-        ts = datetime.now()
+        ts = time.time()
 
         self.isac_node = isac_node
         self.uri = uri
+        self.yield_policy = isac_node.yield_policy if yield_policy is None else yield_policy
         self._metadata = metadata
-        self.observers = Observable() if observers is None else observers
-        self._static_tags = {} if static_tags is None else static_tags
-        self._dynamic_tags = {} if dynamic_tags is None else dynamic_tags
-        self.metadata_observers = Observable()
+        if publish_policy is None:
+            publish_policy = PublishPolicy.from_metadata(metadata)
+        self.publish_policy = publish_policy
+        self._observers = observers
+        self._metadata_observers = None
+        self._static_tags = _NO_TAGS if static_tags is None else static_tags
+        self._dynamic_tags = _NO_TAGS if dynamic_tags is None else dynamic_tags
+        self._value, self._ts, self._timestamp = None, 0.0, None
+        self.survey_future = None
+
+        if background_survey:
+            self._init_value_nowait(initial_value, ts, survey_last_value)
+            self.survey_future = Future.spawn(
+                self._survey_in_background, initial_value, survey_last_value, survey_static_tags)
+        else:
+            self._init_value(initial_value, ts, survey_last_value, survey_static_tags)
+
+        # print('>>>>>', self.uri, id(self), type(self._metadata), self._metadata)
+        if self._metadata:
+            self.isac_node.event_value_metadata_update(
+                self.uri, self._metadata, self.isac_node.name_uuid())
 
-        self.isac_node.rpc.register(
-            lambda: (self._value, self.timestamp_float),
-            name=self.uri
-        )
+        self.isac_node.subscribe(self.uri, self)
 
+        self.isac_node.event_isac_value_entering(self.uri)
+
+    def _init_value(self, initial_value, ts, survey_last_value, survey_static_tags):
         if not self._static_tags and survey_static_tags:
-            self._static_tags = self.isac_node.survey_value_static_tags(self.uri)
+            self._static_tags = self.isac_node.survey_value_static_tags(self.uri) or _NO_TAGS
 
-        self._value = initial_value
         if initial_value is None:
-            self._value, self._timestamp = None, datetime.fromtimestamp(0)
             if survey_last_value:
                 self.update_value_from_isac(
                     *self.isac_node.survey_last_value(self.uri, limit_peers=1))
@@ -56,17 +92,12 @@ class IsacValue(object):
                 last_value, last_ts_float, tags = self.isac_node.survey_last_value(
                     self.uri, limit_peers=1)
 
-                if isinstance(initial_value[1], datetime):
-                    last_ts = datetime.fromtimestamp(last_ts_float)
-                else:
-                    last_ts = last_ts_float
-
-                if initial_value[1] > last_ts:  # We want to publish our last value to anyone outside
+                if _to_ts_float(initial_value[1]) > last_ts_float:
+                    # We want to publish our last value to anyone outside
                     logger.debug('(%s, %s) publishing former value: %s',
                                  self.isac_node.name, self.uri, initial_value)
                     self.value_ts = initial_value
                 else:  # We want to notify all our internal subscribers of the newer last value
-                    self._value, self._timestamp = None, datetime.fromtimestamp(0)
                     self.update_value_from_isac(last_value, last_ts_float, tags)
 
         else:
@@ -74,74 +105,112 @@ class IsacValue(object):
                          self.isac_node.name, self.uri, initial_value)
             self.value_ts = initial_value, ts
 
-        # print('>>>>>', self.uri, id(self), type(self._metadata), self._metadata)
-        if self._metadata:
-            self.isac_node.event_value_metadata_update(
-                self.uri, self._metadata, self.isac_node.name_uuid())
+    def _init_value_nowait(self, initial_value, ts, survey_last_value):
+        if initial_value is None:
+            return
 
-        self.isac_node.subscribe(self.uri, self)
+        if not isinstance(initial_value, tuple):
+            self.value_ts = initial_value, ts
+        elif survey_last_value:
+            # Only kept locally until we know whether someone has a newer value
+            self._value = initial_value[0]
+            self._set_ts(initial_value[1])
+        else:
+            self.value_ts = initial_value
 
-        self.isac_node.event_isac_value_entering(self.uri)
+    def _survey_in_background(self, initial_value, survey_last_value, survey_static_tags):
+        if not self._static_tags and survey_static_tags:
+            self._static_tags = self.isac_node.survey_value_static_tags(self.uri) or _NO_TAGS
 
-    def __del__(self):
-        self.isac_node.rpc.unregister(self.uri)
+        if not survey_last_value:
+            return
+        if (initial_value is not None) and not isinstance(initial_value, tuple):
+            return
+
+        last_value, last_ts_float, tags = self.isac_node.survey_last_value(self.uri, limit_peers=1)
+        if initial_value is not None:
+            initial_ts_float = _to_ts_float(initial_value[1])
+            if (initial_ts_float > last_ts_float) and (self._ts == initial_ts_float):
+                logger.debug('(%s, %s) publishing former value: %s',
+                             self.isac_node.name, self.uri, initial_value)
+                self.publish_value(self._value, self._ts, self._tags())
+                return
+
+        # Nobody answered, or anything newer was received or set in the meantime:
+        # the value is kept as is
+        if (not last_ts_float) or (last_ts_float <= self._ts):
+            return
+        self.update_value_from_isac(last_value, last_ts_float, tags)
 
     # Value property
 
     @property
     def value(self):
-        green.sleep(0.001)
+        self.yield_policy()
         return self._value
 
     @value.setter
     def value(self, new_value):
-        ts = datetime.now()
         self._value = new_value
-        self._timestamp = ts
-        self.publish_value(self._value, self._timestamp, self._dynamic_tags)
+        self._ts = time.time()
+        self._timestamp = None
+        self.publish_value(self._value, self._ts, self._tags())
 
     # TS property
 
     @property
     def timestamp(self):
-        green.sleep(0.001)
-        return self._timestamp
+        self.yield_policy()
+        return self._datetime()
 
     @property
     def timestamp_float(self):
-        green.sleep(0.001)
-        return time.mktime(self._timestamp.timetuple()) + (self._timestamp.microsecond / 1000000.0)
+        self.yield_policy()
+        return self._ts
+
+    def _set_ts(self, ts):
+        if isinstance(ts, datetime):
+            self._ts = _to_ts_float(ts)
+            self._timestamp = ts
+        else:
+            self._ts = ts
+            self._timestamp = None
+
+    def _datetime(self):
+        # Only build the datetime when a user actually wants it
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self._ts)
+        return self._timestamp
 
     # Value/TS property
 
     @property
     def value_ts(self):
-        green.sleep(0.001)
-        return self._value, self._timestamp
+        self.yield_policy()
+        return self._value, self._datetime()
 
     @value_ts.setter
     def value_ts(self, args):
         value, ts = args
         self._value = value
-        if isinstance(ts, datetime):
-            self._timestamp = ts
-        else:
-            self._timestamp = datetime.fromtimestamp(ts)
-
-        self.publish_value(self._value, self._timestamp, self._dynamic_tags)
+        self._set_ts(ts)
+        self.publish_value(self._value, self._ts, self._tags())
 
     # Static tags property
 
     @property
     def static_tags(self):
+        # Created on first access, so that static tags can still be added afterwards
+        if self._static_tags is _NO_TAGS:
+            self._static_tags = {}
         return self._static_tags
 
     # Dynamic tags property
 
     @property
     def tags(self):
-        green.sleep(0.001)
-        return self._dynamic_tags
+        self.yield_policy()
+        return self._tags()
 
     @tags.setter
     def tags(self, tags):
@@ -151,8 +220,8 @@ class IsacValue(object):
 
     @property
     def value_tags(self):
-        green.sleep(0.001)
-        return self._value, self._dynamic_tags
+        self.yield_policy()
+        return self._value, self._tags()
 
     @value_tags.setter
     def value_tags(self, args):
@@ -164,15 +233,15 @@ class IsacValue(object):
 
     @property
     def ts_tags(self):
-        green.sleep(0.001)
-        return self._timestamp, self._dynamic_tags
+        self.yield_policy()
+        return self._datetime(), self._tags()
 
     # Value/TS/Dynamic tags property
 
     @property
     def value_ts_tags(self):
-        green.sleep(0.001)
-        return self._value, self._timestamp, self._dynamic_tags
+        self.yield_policy()
+        return self._value, self._datetime(), self._tags()
 
     @value_ts_tags.setter
     def value_ts_tags(self, args):
@@ -180,6 +249,42 @@ class IsacValue(object):
         self._dynamic_tags = tags
         self.value_ts = value, ts
 
+    # Non-yielding accessors
+
+    @property
+    def value_nowait(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value, self._ts, self._tags()
+
+    def _tags(self):
+        if self._dynamic_tags is _NO_TAGS:
+            self._dynamic_tags = {}
+        return self._dynamic_tags
+
+    # Observers
+
+    @property
+    def observers(self):
+        if self._observers is None:
+            self._observers = Observable()
+        return self._observers
+
+    @observers.setter
+    def observers(self, observers):
+        self._observers = observers
+
+    @property
+    def metadata_observers(self):
+        if self._metadata_observers is None:
+            self._metadata_observers = Observable()
+        return self._metadata_observers
+
+    @metadata_observers.setter
+    def metadata_observers(self, observers):
+        self._metadata_observers = observers
+
     # Metadata property
 
     @property
@@ -189,6 +294,9 @@ class IsacValue(object):
     @metadata.setter
     def metadata(self, metadata):
         self._metadata = metadata
+        publish_policy = PublishPolicy.from_metadata(metadata)
+        if publish_policy is not None:
+            self.publish_policy = publish_policy
         self.isac_node.event_value_metadata_update(
             self.uri, self._metadata, self.isac_node.name_uuid())
 
@@ -197,50 +305,133 @@ class IsacValue(object):
             return
 
         self._metadata = metadata
-        if self._metadata:
-            self.metadata_observers(self, self._metadata, source_peer)
+        if self._metadata and self._metadata_observers:
+            self._metadata_observers(self, self._metadata, source_peer)
 
     def update_value_from_isac(self, new_value, ts_float, tags):
-        if ts_float > self.timestamp_float:
+        if ts_float > self._ts:
             logger.debug('(%s, %s) Got newer value: %s, %s, %s',
                          self.isac_node.name, self.uri, new_value, ts_float, tags)
             self._value = new_value
-            self._timestamp = datetime.fromtimestamp(ts_float)
+            self._ts = ts_float
+            self._timestamp = None
             self._dynamic_tags = tags
-            self.observers(self, self._value, self._timestamp, self._dynamic_tags)
-        elif ts_float < self.timestamp_float:
+            if self._observers:
+                self._observers(self, self._value, self._datetime(), self._dynamic_tags)
+        elif ts_float < self._ts:
             logger.warning(
                 '(%s, %s) Trying to update value with a value older than what we have (%f vs. %f)',
-                self.isac_node.name, self.uri, ts_float, self.timestamp_float
+                self.isac_node.name, self.uri, ts_float, self._ts
             )
         # else equal time => do nothing
 
-    def publish_value(self, value, ts, tags):
-        ts_float = self.timestamp_float
+    def publish_value(self, value, ts_float, tags):
         tags.update(self.isac_node.name_uuid())
 
+        if self.publish_policy is None:
+            self._send(value, ts_float, tags)
+        else:
+            self.publish_policy.submit(self._send, value, ts_float, tags)
+
+    def _send(self, value, ts_float, tags):
         logger.debug('(%s, %s) Publishing: %s, %s, %s',
                      self.isac_node.name, self.uri, value, ts_float, tags)
-        self.isac_node.pub_sub.publish(self.uri, (value, ts_float, tags))
+        self.isac_node.publish(self.uri, (value, ts_float, tags))
 
     def survey_metadata(self):
         self._set_metadata(*self.isac_node.survey_value_metadata(self.uri))
 
-    def get_history(self, time_period):
-        t1, t2 = time_period
-        if isinstance(t1, datetime):
-            t1 = time.mktime(t1.timetuple()) + (t1.microsecond * 1e-6)
-        if isinstance(t2, datetime):
-            t2 = time.mktime(t2.timetuple()) + (t2.microsecond * 1e-6)
+    def get_history(self, time_period, bucket=None, aggregates=DEFAULT_AGGREGATES,
+                    columnar=False, compressed=False, merge=False):
+        # With a bucket width (seconds or timedelta) the archiving peer aggregates the
+        # points and only returns one ({function: result}, bucket_start, {}) per bucket.
+        # Columnar results are (timestamps, values, [(index, tags), ...]), see unpack_columns.
+        # Compressed transfers use the delta-of-delta/XOR encoding of isac.history.codec
+        options = query_options(bucket, aggregates, columnar, compressed)
+        if merge:
+            if options:
+                raise ValueError('Merged history is only available as raw points')
+            return list(self.iter_history(time_period, merge=True))
+
+        t1, t2 = map(_to_ts_float, time_period)
+        func_name = '.'.join((self.uri, 'get_history_impl'))
 
-        peer_name = self.isac_node.survey_value_history(self.uri, (t1, t2))
-        if not peer_name:
+        # The archiver is cached by the node: when it does not answer any more,
+        # it is forgotten and a new one is surveyed once
+        cached = self.uri in self.isac_node.history_peer_cache
+        while True:
+            peer_name = self._history_peers((t1, t2), merge=False)[0]
+            try:
+                data = self.isac_node.rpc.call_on(peer_name, func_name, (t1, t2), **options)
+            except Exception as ex:
+                if not _is_peer_failure(ex):
+                    raise
+                self.isac_node.forget_history_peer(self.uri)
+                if not cached:
+                    raise
+                logger.debug('Cached archiver %s of %s failed', peer_name, self.uri)
+                cached = False
+                continue
+            return decode_result(data, options)
+
+    def iter_history(self, time_period, chunk_size=10000, merge=False):
+        # Points are pulled chunk by chunk, the next chunk being fetched while the
+        # current one is consumed, so memory use does not depend on the period length.
+        # With merge, the streams of all the archiving peers are merged on timestamps.
+        t1, t2 = map(_to_ts_float, time_period)
+
+        peer_names = self._history_peers((t1, t2), merge)
+        fetches = [self._history_fetch(peer_name, (t1, t2)) for peer_name in peer_names]
+
+        # The first chunks of all the peers are requested at once, before the merge
+        # waits on any of them
+        firsts = [Future.spawn(fetch, None, chunk_size) for fetch in fetches]
+        streams = [
+            self._iter_peer_history(fetch, first, chunk_size)
+            for fetch, first in zip(fetches, firsts)
+        ]
+        points = streams[0] if len(streams) == 1 else merge_streams(streams)
+        try:
+            for point in points:
+                yield point[0], datetime.fromtimestamp(point[1]), point[2]
+        finally:
+            for stream in streams:
+                stream.close()
+            for first in firsts:
+                first.cancel()
+
+    def _history_peers(self, time_period, merge):
+        if merge:
+            peer_names = self.isac_node.survey_values_history(
+                [self.uri], time_period).get(self.uri, [])
+        else:
+            peer_name = self.isac_node.survey_value_history(self.uri, time_period)
+            peer_names = [peer_name] if peer_name else []
+
+        if not peer_names:
             raise NoPeerWithHistoryException(
                 'Could not find any peer that could provide history for %s' % self.uri)
-
-        func_name = '.'.join((self.uri, 'get_history_impl'))
-        data = self.isac_node.rpc.call_on(peer_name, func_name, (t1, t2))
-        return [(point[0], datetime.fromtimestamp(point[1]), point[2]) for point in data]
+        return peer_names
+
+    def _history_fetch(self, peer_name, time_period):
+        # fetch(cursor, max_points) reads a chunk of the history of peer_name
+        func_name = '.'.join((self.uri, 'get_history_chunk_impl'))
+        return partial(self.isac_node.rpc.call_on, peer_name, func_name, time_period)
+
+    def _iter_peer_history(self, fetch, future, chunk_size):
+        try:
+            while future is not None:
+                try:
+                    points, cursor = future.result()
+                except Exception as ex:
+                    if _is_peer_failure(ex):
+                        self.isac_node.forget_history_peer(self.uri)
+                    raise
+                future = None if cursor is None else Future.spawn(fetch, cursor, chunk_size)
+                yield from points
+        finally:
+            if future is not None:
+                future.cancel()
 
     def __str__(self):
         return '{0}: {1}'.format(self.timestamp, self.value)
@@ -248,17 +439,66 @@ class IsacValue(object):
 
 class ArchivedValue(IsacValue):
 
-    def __init__(self, *args, **kwargs):
-        super(ArchivedValue, self).__init__(*args, **kwargs)
+    __slots__ = ('history',)
+
+    # Most points sent in one history chunk, whatever the requester asks for
+    max_chunk_points = 10000
+
+    def __init__(self, isac_node, uri, *args, history=None, history_capacity=100000, **kwargs):
+        if history is None:
+            retention = None if isac_node.retention is None else isac_node.retention.for_uri(uri)
+            if retention is None:
+                history = RingBufferStore(history_capacity)
+            else:
+                history = TieredStore(retention, capacity=history_capacity)
+        self.history = history
+
+        # History procedures are resolved by IsacNode._value_rpc, registering bound
+        # methods would keep the value alive forever
+        super(ArchivedValue, self).__init__(isac_node, uri, *args, **kwargs)
+
+        # Persistent stores release their files and maps once the value is gone
+        close = getattr(history, 'close', None)
+        if close is not None:
+            weakref.finalize(self, close)
+
+    def publish_value(self, value, ts_float, tags):
+        super(ArchivedValue, self).publish_value(value, ts_float, tags)
+        self.history.append(ts_float, value, tags)
+
+    def update_value_from_isac(self, new_value, ts_float, tags):
+        if ts_float > self._ts:
+            self.history.append(ts_float, new_value, tags)
+        super(ArchivedValue, self).update_value_from_isac(new_value, ts_float, tags)
 
-        self.isac_node.rpc.register(
-            self.get_history_impl,
-            name='.'.join((self.uri, 'get_history_impl'))
-        )
+    def get_history_impl(self, time_period, bucket=None, aggregates=DEFAULT_AGGREGATES,
+                         columnar=False, compressed=False):
+        if compressed:
+            return b64encode(encode_block(*self.history.columns(*time_period))).decode()
+        if columnar:
+            return pack_columns(*self.history.columns(*time_period))
+        if bucket is None:
+            return self.history.range(*time_period)
+        return self.history.aggregate(time_period[0], time_period[1], bucket, aggregates)
 
-    def get_history_impl(self, time_period):
-        return []
+    def get_history_chunk_impl(self, time_period, cursor, max_points):
+        max_points = max(1, min(max_points, self.max_chunk_points))
+        return self.history.chunk(time_period[0], time_period[1], cursor, max_points)
 
 
 class NoPeerWithHistoryException(Exception):
     pass
+
+
+def _is_peer_failure(ex):
+    # Errors telling the peer can not serve the history any more, as opposed to
+    # errors raised by the history procedure itself
+    if isinstance(ex, RemoteRPCError):
+        return ex.ename == 'UnknownProcedureError'
+    return isinstance(ex, (KeyError, RPCError))
+
+
+def _to_ts_float(ts):
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    return ts
@@ -0,0 +1,127 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging
+import time
+
+# Third-party imports
+
+# Local imports
+from isac.tools import green, is_number
+
+logger = logging.getLogger(__name__)
+
+_NOTHING = object()
+
+
+class PublishPolicy(object):
+    """ Decide which local updates of an IsacValue actually get published
+
+    Updates identical to the last published one (in change_only mode), within its
+    deadband, or coming less than min_interval seconds after it, are suppressed.
+    When trailing is set, the last update suppressed by the rate limit is published
+    once min_interval has elapsed. When keepalive is set, an unchanged value is
+    published anyway if nothing went out for keepalive seconds.
+    """
+
+    def __init__(
+        self, deadband=None, relative_deadband=None, min_interval=None, trailing=True,
+        change_only=False, keepalive=None
+    ):
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+        self.min_interval = min_interval
+        self.trailing = trailing
+        self.change_only = change_only
+        self.keepalive = keepalive
+
+        self.published = 0
+        self.suppressed = 0
+
+        self._last_value = _NOTHING
+        self._last_tags = None
+        self._last_publish = None
+        self._pending = None
+        self._trailing_task = None
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        if metadata and isinstance(metadata.get('publish_policy', None), dict):
+            return cls(**metadata['publish_policy'])
+        return None
+
+    def submit(self, publish, value, ts_float, tags):
+        now = time.monotonic()
+
+        if self._unchanged(value, tags) or self._in_deadband(value):
+            if not self._keepalive_due(now):
+                self.suppressed += 1
+                if self._pending is not None:
+                    # The trailing publish is for the latest value, it is dropped
+                    # if that one ends up close enough to the last published value
+                    self._pending = (value, ts_float, tags)
+                return
+
+        elif self._rate_limited(now):
+            self.suppressed += 1
+            self._pending = (value, ts_float, tags)
+            if self.trailing and (self._trailing_task is None):
+                delay = self.min_interval - (now - self._last_publish)
+                self._trailing_task = green.spawn_later(delay, self._publish_trailing, publish)
+            return
+
+        self._publish(publish, value, ts_float, tags, now)
+
+    def _publish(self, publish, value, ts_float, tags, now):
+        self._pending = None
+        self._last_value = value
+        if self.change_only:
+            self._last_tags = dict(tags)
+        self._last_publish = now
+        self.published += 1
+        publish(value, ts_float, tags)
+
+    def _publish_trailing(self, publish):
+        self._trailing_task = None
+        if self._pending is None:
+            return
+
+        value, ts_float, tags = self._pending
+        if self._unchanged(value, tags) or self._in_deadband(value):
+            self._pending = None
+            return
+
+        logger.debug('Trailing publish of %s', value)
+        self._publish(publish, value, ts_float, tags, time.monotonic())
+
+    def _unchanged(self, value, tags):
+        if not self.change_only or (self._last_value is _NOTHING):
+            return False
+        return (value == self._last_value) and (tags == self._last_tags)
+
+    def _keepalive_due(self, now):
+        if not self.keepalive:
+            return False
+        return (now - self._last_publish) >= self.keepalive
+
+    def _in_deadband(self, value):
+        if (self._last_value is _NOTHING) or not (self.deadband or self.relative_deadband):
+            return False
+        if not (is_number(value) and is_number(self._last_value)):
+            return False
+
+        delta = abs(value - self._last_value)
+        if self.deadband and (delta <= self.deadband):
+            return True
+        if self.relative_deadband and (delta <= self.relative_deadband * abs(self._last_value)):
+            return True
+        return False
+
+    def _rate_limited(self, now):
+        if (self._last_publish is None) or not self.min_interval:
+            return False
+        return (now - self._last_publish) < self.min_interval
@@ -15,6 +15,8 @@ from .survey_value_static_tags import SurveyValueStaticTags
 from .survey_value_metadata import SurveyValueMetadata
 from .survey_values_metadata import SurveyValuesMetadata
 from .survey_value_history import SurveyValueHistory
+from .survey_values_history import SurveyValuesHistory
+from .survey_values_state import SurveyValuesState
 
 
 __all__ = [
@@ -24,4 +26,6 @@ __all__ = [
     'SurveyValueMetadata',
     'SurveyValuesMetadata',
     'SurveyValueHistory',
+    'SurveyValuesHistory',
+    'SurveyValuesState',
 ]
@@ -26,15 +26,12 @@ class SurveyLastValue(Survey):
         logger.debug('(%s) Survey request for last value of %s', self.isac_node.name, uri)
 
         if uri in self.isac_node.isac_values:
-            isac_value = self.isac_node.isac_values[uri]
+            value, ts_float, tags = self.isac_node.isac_values[uri].snapshot()
             logger.debug(
                 '(%s) Responding to survey for %s: (%s) %s, %s',
-                self.isac_node.name, uri, isac_value.timestamp, isac_value.value, isac_value.tags
-            )
-            self.reply(
-                peer_id, request_id,
-                (isac_value.value, isac_value.timestamp_float, isac_value.tags)
+                self.isac_node.name, uri, ts_float, value, tags
             )
+            self.reply(peer_id, request_id, (value, ts_float, tags))
         else:
             logger.debug('(%s) I don\'t know %s, not responding', self.isac_node.name, uri)
 
@@ -26,7 +26,7 @@ class SurveyValueHistory(Survey):
         logger.debug('(%s) Survey request for history of value %s', self.isac_node.name, uri)
 
         if uri in self.isac_node.isac_values:
-            if '.'.join((uri, 'get_history_impl')) not in self.isac_node.rpc.rpc_service.procedures:
+            if self.isac_node.archived_value(uri) is None:
                 logger.debug(
                     '(%s) I know %s but I don\'t have any history for it. Not responding to survey',
                     self.isac_node.name, uri
@@ -0,0 +1,39 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging
+
+# Third-party imports
+
+# Local imports
+from .. import Survey
+
+logger = logging.getLogger(__name__)
+
+
+class SurveyValuesHistory(Survey):
+
+    def process_request(self, peer_id, request_id, uris, time_period):
+        logger.debug(
+            '(%s) Survey request for history of %d values', self.isac_node.name, len(uris))
+
+        archived = [uri for uri in uris if self.isac_node.archived_value(uri) is not None]
+
+        if archived:
+            self.reply(peer_id, request_id, archived)
+        else:
+            logger.debug('(%s) I don\'t have history for any of these values, not responding',
+                         self.isac_node.name)
+
+    def process_result(self, results):
+        # Archiving peers of every value, in the order they answered
+        peers = {}
+        for peer_name, archived in results:
+            for uri in archived:
+                peers.setdefault(uri, []).append(peer_name)
+
+        return peers
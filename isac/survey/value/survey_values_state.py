@@ -0,0 +1,54 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging
+
+# Third-party imports
+
+# Local imports
+from .. import Survey
+
+logger = logging.getLogger(__name__)
+
+
+class SurveyValuesState(Survey):
+
+    def process_request(self, peer_id, request_id, uris):
+        logger.debug('(%s) Survey request for state of %d values', self.isac_node.name, len(uris))
+
+        states = {}
+        for uri in uris:
+            if uri not in self.isac_node.isac_values:
+                continue
+
+            isac_value = self.isac_node.isac_values[uri]
+            value, ts_float, tags = isac_value.snapshot()
+            if ts_float or isac_value.static_tags:
+                states[uri] = ((value, ts_float, tags), dict(isac_value.static_tags))
+
+        if states:
+            logger.debug(
+                '(%s) Responding to state survey for %d values', self.isac_node.name, len(states))
+            self.reply(peer_id, request_id, states)
+        else:
+            logger.debug('(%s) I don\'t know any of these values, not responding',
+                         self.isac_node.name)
+
+    def process_result(self, results):
+        states = {}
+        for peer_name, result in results:
+            for uri, (last_value, static_tags) in result.items():
+                if uri not in states:
+                    states[uri] = (tuple(last_value), static_tags)
+                    continue
+
+                known_last_value, known_static_tags = states[uri]
+                if last_value[1] > known_last_value[1]:
+                    known_last_value = tuple(last_value)
+                states[uri] = (known_last_value, known_static_tags or static_tags)
+
+        return states
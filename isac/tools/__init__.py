@@ -9,6 +9,11 @@
 # Third-party imports
 
 # Local imports
-from .concurrency import green, zmq, Executor, Future  # noqa: F401
+from .concurrency import green, zmq, Executor, Future, Lock  # noqa: F401
 from .observable import Observable  # noqa: F401
+from .ttl_cache import TTLCache  # noqa: F401
+from .values import is_number, is_double  # noqa: F401
 from .debug import spy_object, spy_call, w_spy_call  # noqa: F401
+from .yield_policy import (  # noqa: F401
+    YieldPolicy, AlwaysYield, NeverYield, YieldEvery, YieldTimeSliced
+)
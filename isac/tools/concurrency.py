@@ -9,6 +9,7 @@
 # Third-party imports
 import gevent as green  # noqa: F401
 import zmq.green as zmq  # noqa: F401
+from gevent.lock import Semaphore as Lock  # noqa: F401
 from gevent.pool import Group as _Group, Pool as _Pool
 
 # Local imports
@@ -0,0 +1,80 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import time
+from collections import OrderedDict
+
+# Third-party imports
+
+# Local imports
+
+
+class TTLCache(object):
+    """ A LRU cache whose entries expire ttl seconds after being stored
+    """
+
+    def __init__(self, ttl=0, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+    @property
+    def enabled(self):
+        return bool(self.ttl) and (self.maxsize > 0)
+
+    def peek(self, key):
+        entry = self._entries.get(key, None)
+        if entry is None:
+            return None
+
+        expiry, value = entry
+        if expiry < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def get(self, key):
+        value = self.peek(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def evict(self, predicate):
+        # Drop the entries for which predicate(key, value) is true
+        keys = [key for key, (expiry, value) in self._entries.items() if predicate(key, value)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
@@ -0,0 +1,22 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+
+# Third-party imports
+
+# Local imports
+
+
+def is_number(value):
+    # Numbers that can be aggregated, booleans excluded
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_double(value):
+    # Values stored as is in double columns, integers keep their type (and
+    # precision beyond 2**53) by staying out of them
+    return isinstance(value, float)
@@ -0,0 +1,69 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import time
+
+# Third-party imports
+
+# Local imports
+from .concurrency import green
+
+
+class YieldPolicy(object):
+    """ Decide when a property read should cooperatively yield to other greenlets
+    """
+
+    def __init__(self, duration=0.001):
+        self.duration = duration
+
+    def __call__(self):
+        green.sleep(self.duration)
+
+
+class AlwaysYield(YieldPolicy):
+    pass
+
+
+class NeverYield(YieldPolicy):
+
+    def __init__(self):
+        super(NeverYield, self).__init__(0)
+
+    def __call__(self):
+        pass
+
+
+class YieldEvery(YieldPolicy):
+
+    def __init__(self, reads, duration=0.001):
+        super(YieldEvery, self).__init__(duration)
+        if reads < 1:
+            raise ValueError('reads should be at least 1')
+
+        self.reads = reads
+        self._count = 0
+
+    def __call__(self):
+        self._count += 1
+        if self._count >= self.reads:
+            self._count = 0
+            green.sleep(self.duration)
+
+
+class YieldTimeSliced(YieldPolicy):
+
+    def __init__(self, time_slice=0.01, duration=0):
+        super(YieldTimeSliced, self).__init__(duration)
+
+        self.time_slice = time_slice
+        self._last_yield = time.monotonic()
+
+    def __call__(self):
+        now = time.monotonic()
+        if (now - self._last_yield) >= self.time_slice:
+            green.sleep(self.duration)
+            self._last_yield = time.monotonic()
@@ -12,4 +12,7 @@
 # Local imports
 from .pyre_node import PyreNode  # noqa: F401
 from .zmq_pub_sub import ZmqPubSub  # noqa: F401
-from .zmq_router_dealer_rpc import ZmqRPC  # noqa: F401
+from .codecs import Codec, CODECS, DEFAULT_CODECS, register_codec  # noqa: F401
+from .zmq_router_dealer_rpc import (  # noqa: F401
+    ZmqRPC, RPCError, RemoteRPCError, UnknownProcedureError
+)
@@ -0,0 +1,187 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import struct
+
+# Third-party imports
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Local imports
+
+
+class Codec(object):
+    """ Serialization of the payloads sent on PUB/SUB
+
+    Payloads are (value, ts_float, tags) updates, or lists of [uri, update] for
+    batches. Decoding gives back lists, as JSON does.
+    """
+
+    name = None
+
+    def encode(self, data):
+        raise NotImplementedError()
+
+    def decode(self, payload):
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+
+    name = 'json'
+
+    def encode(self, data):
+        return json.dumps(data).encode()
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class MsgpackCodec(Codec):
+
+    name = 'msgpack'
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+class StructCodec(Codec):
+    """ Numeric values and timestamps packed as binary, tags as JSON
+
+    The first byte of a payload tells its layout:
+      f: double value, double ts, JSON tags
+      i: int64 value, double ts, JSON tags
+      n: None value, double ts, JSON tags
+      j: JSON, for anything else
+      b: batch, point count, one layout byte per point, the packed numbers of all
+         the points, then a single JSON list of [uri, tags] ([uri, data] for j points)
+    """
+
+    name = 'struct'
+
+    _NUMBERS = {b'f'[0]: struct.Struct('<dd'), b'i'[0]: struct.Struct('<qd')}
+    _NONE = struct.Struct('<d')
+    _COUNT = struct.Struct('<I')
+    _INT_RANGE = (-(1 << 63), 1 << 63)
+
+    def _layout(self, data):
+        if not _is_update(data):
+            return b'j'
+        value = data[0]
+        if value is None:
+            return b'n'
+        if isinstance(value, float):
+            return b'f'
+        if (isinstance(value, int) and not isinstance(value, bool) and
+                (self._INT_RANGE[0] <= value < self._INT_RANGE[1])):
+            return b'i'
+        return b'j'
+
+    def _pack(self, layout, data):
+        if layout == b'n':
+            return self._NONE.pack(data[1])
+        return self._NUMBERS[layout[0]].pack(data[0], data[1])
+
+    def encode(self, data):
+        if _is_batch(data):
+            return self._encode_batch(data)
+
+        layout = self._layout(data)
+        if layout == b'j':
+            return b'j' + json.dumps(data).encode()
+        return layout + self._pack(layout, data) + json.dumps(data[2]).encode()
+
+    def _encode_batch(self, batch):
+        layouts = []
+        numbers = []
+        meta = []
+        for uri, data in batch:
+            layout = self._layout(data)
+            layouts.append(layout)
+            if layout == b'j':
+                meta.append([uri, data])
+            else:
+                numbers.append(self._pack(layout, data))
+                meta.append([uri, data[2]])
+        return b''.join(
+            [b'b', self._COUNT.pack(len(batch))] + layouts + numbers +
+            [json.dumps(meta).encode()]
+        )
+
+    def decode(self, payload):
+        layout = payload[0]
+        if layout == b'j'[0]:
+            return json.loads(payload[1:])
+        if layout == b'b'[0]:
+            return self._decode_batch(payload)
+
+        data, offset = self._unpack(layout, payload, 1)
+        data.append(json.loads(payload[offset:]))
+        return data
+
+    def _unpack(self, layout, payload, offset):
+        if layout == b'n'[0]:
+            return [None, self._NONE.unpack_from(payload, offset)[0]], offset + self._NONE.size
+        numbers = self._NUMBERS.get(layout, None)
+        if numbers is None:
+            raise ValueError('Unknown struct payload layout %r' % chr(layout))
+        return list(numbers.unpack_from(payload, offset)), offset + numbers.size
+
+    def _decode_batch(self, payload):
+        count, = self._COUNT.unpack_from(payload, 1)
+        offset = 1 + self._COUNT.size
+        layouts = payload[offset:offset + count]
+        offset += count
+
+        numbers = []
+        for layout in layouts:
+            if layout == b'j'[0]:
+                numbers.append(None)
+            else:
+                data, offset = self._unpack(layout, payload, offset)
+                numbers.append(data)
+
+        batch = json.loads(payload[offset:])
+        for item, data in zip(batch, numbers):
+            if data is not None:
+                data.append(item[1])
+                item[1] = data
+        return batch
+
+
+def _is_update(data):
+    return (
+        isinstance(data, (tuple, list)) and (len(data) == 3) and
+        isinstance(data[1], float) and isinstance(data[2], dict)
+    )
+
+
+def _is_batch(data):
+    return (
+        isinstance(data, list) and bool(data) and
+        all(isinstance(item, (tuple, list)) and (len(item) == 2) and
+            isinstance(item[0], str) for item in data)
+    )
+
+
+# Available codecs, by name
+CODECS = {codec.name: codec for codec in (JsonCodec(), StructCodec())}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+# Preferred first. JSON is the one every peer understands.
+DEFAULT_CODECS = tuple(name for name in ('msgpack', 'struct', 'json') if name in CODECS)
+
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
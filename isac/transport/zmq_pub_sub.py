@@ -5,52 +5,222 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 # System imports
+import hashlib
 import json
 import logging
+import time
+import weakref
+from functools import lru_cache
 
 # Third-party imports
 
 # Local imports
 from ..tools import green, zmq
+from .codecs import CODECS, DEFAULT_CODECS
 
 
 logger = logging.getLogger(__name__)
 
+# Topic carrying several (uri, data) updates in one frame. Every node subscribes to it,
+# so batches escape the topic filtering done inside ZMQ: they are decoded in full and
+# their updates for URIs nobody subscribed to are counted in discarded_messages.
+BATCH_TOPIC = b'\x00batch'
+
+# Messages are [topic, codec name, payload]. Peers not advertising the codecs they
+# support only read [topic, JSON payload], which is sent as long as one of them is around.
+CODECS_HEADER = 'pub_codecs'
+
+# The topic frame of [topic, codec name, payload] messages is a fixed length ID hashed
+# from the URI, see topic_id. Being fixed length, ZMQ prefix matching on it is exact:
+# sensor://a/temp does not get sensor://a/temp2. Legacy peers send raw URIs, which are
+# also subscribed to as long as one of them is around.
+TOPIC_ID_PREFIX = b'\x01'
+TOPIC_ID_SIZE = 8
+
+
+@lru_cache(maxsize=10000)
+def topic_id(uri):
+    # Every node derives the same ID, so the URI -> ID mapping needs no exchange
+    return TOPIC_ID_PREFIX + hashlib.blake2b(uri.encode(), digest_size=TOPIC_ID_SIZE).digest()
+
 
 class ZmqPubSub(object):
 
-    def __init__(self, context, callback):
+    def __init__(self, context, callback, max_batch_size=500, codecs=DEFAULT_CODECS):
         self.context = context
         self.callback = callback
+        self.max_batch_size = max_batch_size
+
+        # Supported codecs, preferred first, and those of the peers (None for legacy ones)
+        self.codecs = [name for name in codecs if name in CODECS]
+        if 'json' not in self.codecs:
+            self.codecs.append('json')
+        self.peer_codecs = {}
+        self.peer_endpoints = {}
+        self.codec = CODECS[self.codecs[0]]
+        self.transport = None
+
+        # Subscribed URIs by topic ID, their subscriptions by URI, and messages (or
+        # batched updates) read on SUB that nobody subscribed to
+        self.topics = {}
+        self._subscriptions = {}
+        self.discarded_messages = 0
+        self._raw_subscriptions = False
+        # Shared by the weak references to all the holders, rather than one bound method each
+        self._holder_callback = self._holder_gone
 
         self.pub = self.context.socket(zmq.PUB)
         self.pub_port = self.pub.bind_to_random_port('tcp://*')
 
         self.sub = self.context.socket(zmq.SUB)
+        self.sub.setsockopt(zmq.SUBSCRIBE, BATCH_TOPIC)
 
     def setup_transport(self, transport):
+        self.transport = transport
         transport.set_header('pub_proto', 'tcp')
         transport.set_header('pub_port', str(self.pub_port))
+        transport.set_header(CODECS_HEADER, ','.join(self.codecs))
 
     def start(self):
         self.running = True
         self.sub_task = green.spawn(self._read_sub)
 
     def subscribe(self, topic, isac_value):
-        logger.info('Subscribing to %s', topic)
-        self.sub.setsockopt(zmq.SUBSCRIBE, topic.encode())
+        # Subscriptions are counted per holder, the topic is unsubscribed
+        # from when the last subscribed isac_value is garbage collected
+        subscription = self._subscriptions.get(topic, None)
+        if subscription is None:
+            tid = topic_id(topic)
+            if tid in self.topics:
+                logger.error('Topic ID collision between %s and %s', self.topics[tid], topic)
+                return
+
+            logger.info('Subscribing to %s', topic)
+            subscription = self._subscriptions[topic] = _Subscription()
+            self.topics[tid] = topic
+            self.sub.setsockopt(zmq.SUBSCRIBE, tid)
+            if self._raw_subscriptions:
+                self.sub.setsockopt(zmq.SUBSCRIBE, topic.encode())
+
+        # A tuple, as most topics have a single holder
+        subscription.holders += (_Holder(isac_value, self._holder_callback, topic),)
+
+    def _holder_gone(self, holder):
+        subscription = self._subscriptions.get(holder.topic, None)
+        if subscription is None:
+            return
+        subscription.holders = tuple(ref for ref in subscription.holders if ref is not holder)
+        if not subscription.holders:
+            self.unsubscribe(holder.topic)
+
+    def unsubscribe(self, topic):
+        if topic not in self._subscriptions:
+            return
+
+        logger.info('Unsubscribing from %s', topic)
+        del self._subscriptions[topic]
+        tid = topic_id(topic)
+        del self.topics[tid]
+        if self.sub.closed:
+            return
+        self.sub.setsockopt(zmq.UNSUBSCRIBE, tid)
+        if self._raw_subscriptions:
+            self.sub.setsockopt(zmq.UNSUBSCRIBE, topic.encode())
+
+    def subscriptions(self):
+        # Active subscriptions: {uri: {holders, messages, rate}}, rate being the
+        # average number of messages per second since the subscription
+        now = time.monotonic()
+        return {
+            topic: {
+                'holders': len(subscription.holders),
+                'messages': subscription.messages,
+                'rate': subscription.messages / max(now - subscription.since, 1e-6),
+            }
+            for topic, subscription in self._subscriptions.items()
+        }
 
     def connect(self, peer_id, peer_name, endpoint):
         # Connect to pub through sub
-        logger.debug('Connecting to PUB endpoint of %s: %s', peer_name, endpoint)
-        self.sub.connect(endpoint)
+        current = self.peer_endpoints.get(peer_id, None)
+        if current != endpoint:
+            if current is not None:
+                self._disconnect_endpoint(current)
+            logger.debug('Connecting to PUB endpoint of %s: %s', peer_name, endpoint)
+            self.sub.connect(endpoint)
+            self.peer_endpoints[peer_id] = endpoint
+
+        codecs = None
+        if self.transport is not None:
+            codecs = self.transport.peer_header_value(peer_id, CODECS_HEADER)
+        # Pyre gives an empty header for peers not setting it
+        self.peer_codecs[peer_id] = codecs.split(',') if codecs else None
+        self._negotiate_codec()
+
+    def disconnect(self, peer_id, peer_name):
+        endpoint = self.peer_endpoints.pop(peer_id, None)
+        if endpoint is not None:
+            logger.debug('Disconnecting from PUB endpoint of %s: %s', peer_name, endpoint)
+            self._disconnect_endpoint(endpoint)
+        self.peer_codecs.pop(peer_id, None)
+        self._negotiate_codec()
+
+    def _disconnect_endpoint(self, endpoint):
+        if self.sub.closed:
+            return
+        try:
+            self.sub.disconnect(endpoint)
+        except zmq.ZMQError as ex:
+            logger.warning('Could not disconnect from %s: %s', endpoint, ex)
+
+    def _negotiate_codec(self):
+        # Best codec understood by every peer, None to send legacy messages
+        legacy = any(codecs is None for codecs in self.peer_codecs.values())
+        self._set_raw_subscriptions(legacy)
+        if legacy:
+            codec = None
+        else:
+            common = [
+                name for name in self.codecs
+                if all(name in codecs for codecs in self.peer_codecs.values())
+            ]
+            codec = CODECS[common[0] if common else 'json']
+
+        if codec is not self.codec:
+            logger.info('Publishing with codec %s', 'legacy JSON' if codec is None else codec.name)
+            self.codec = codec
+
+    def _set_raw_subscriptions(self, enabled):
+        if enabled == self._raw_subscriptions:
+            return
+
+        logger.info('%s raw topic subscriptions', 'Adding' if enabled else 'Removing')
+        option = zmq.SUBSCRIBE if enabled else zmq.UNSUBSCRIBE
+        for topic in self.topics.values():
+            self.sub.setsockopt(option, topic.encode())
+        self._raw_subscriptions = enabled
+
+    def _frames(self, topic, data):
+        if self.codec is None:
+            return [topic, json.dumps(data).encode()]
+        return [topic, self.codec.name.encode(), self.codec.encode(data)]
 
     def publish(self, topic, data):
         logger.debug('Sending on PUB: %r, %r', topic, data)
-        self.pub.send_multipart([
-            topic.encode(),
-            json.dumps(data).encode()
-        ])
+        frame = topic.encode() if self.codec is None else topic_id(topic)
+        self.pub.send_multipart(self._frames(frame, data))
+
+    def publish_many(self, items):
+        # Legacy peers do not subscribe to BATCH_TOPIC, they get the updates one by one
+        if (len(items) == 1) or (self.codec is None):
+            for topic, data in items:
+                self.publish(topic, data)
+            return
+
+        for i in range(0, len(items), self.max_batch_size):
+            chunk = items[i:i + self.max_batch_size]
+            logger.debug('Sending batch of %d updates on PUB', len(chunk))
+            self.pub.send_multipart(self._frames(BATCH_TOPIC, chunk))
 
     def _read_sub(self):
         while self.running:
@@ -62,7 +232,47 @@ class ZmqPubSub(object):
                 if ex.errno == 88:  # "Socket operation on non-socket", basically, socket probably got closed while we were reading
                     continue  # Go to the next iteration to either catch self.running == False or give another chance to retry the read
 
-            self.callback(data[0].decode(), json.loads(data[1]))
+            batch = data[0] == BATCH_TOPIC
+            uri = None if batch else self._topic_uri(data)
+            if (uri is None) and not batch:
+                # Prefix match of a raw subscription
+                self.discarded_messages += 1
+                continue
+
+            payload = self._decode(data)
+            if payload is None:
+                continue
+
+            if batch:
+                # Batches are not filtered by ZMQ, their updates are checked one by one
+                for topic, topic_data in payload:
+                    subscription = self._subscriptions.get(topic, None)
+                    if subscription is None:
+                        self.discarded_messages += 1
+                        continue
+                    subscription.messages += 1
+                    self.callback(topic, topic_data)
+            else:
+                self._subscriptions[uri].messages += 1
+                self.callback(uri, payload)
+
+    def _topic_uri(self, data):
+        if len(data) > 2:
+            return self.topics.get(data[0], None)
+
+        # Legacy message, with the raw URI as topic
+        uri = data[0].decode()
+        return uri if uri in self._subscriptions else None
+
+    def _decode(self, data):
+        if len(data) == 2:
+            return json.loads(data[1])
+
+        codec = CODECS.get(data[1].decode(), None)
+        if codec is None:
+            logger.warning('Dropping message encoded with unknown codec %r', data[1])
+            return None
+        return codec.decode(data[2])
 
     def shutdown(self):
         self.running = False
@@ -72,3 +282,26 @@ class ZmqPubSub(object):
         self.pub.close(0)
         logger.debug('Shutting down SUB')
         self.sub.close(0)
+
+
+class _Holder(weakref.ref):
+    # Weak reference to a subscribed isac_value, a lighter hook than weakref.finalize
+
+    __slots__ = ('topic',)
+
+    def __new__(cls, isac_value, callback, topic):
+        return super(_Holder, cls).__new__(cls, isac_value, callback)
+
+    def __init__(self, isac_value, callback, topic):
+        super(_Holder, self).__init__(isac_value, callback)
+        self.topic = topic
+
+
+class _Subscription(object):
+
+    __slots__ = ('holders', 'messages', 'since')
+
+    def __init__(self):
+        self.holders = ()
+        self.messages = 0
+        self.since = time.monotonic()
@@ -16,7 +16,7 @@ from traceback import format_exc
 # Third-party imports
 
 # Local imports
-from ..tools import zmq, Executor
+from ..tools import zmq, Executor, Lock
 
 
 logger = logging.getLogger(__name__)
@@ -39,11 +39,29 @@ class ZmqRPC(object):
         pass
 
     def connect(self, peer_id, peer_name, endpoint):
-        # connect to rpc server by making an rpc client
+        # connect to rpc server by making an rpc client, reused if the peer enters again
+        current = self.rpc_clients.get(peer_name, None)
+        if current is not None:
+            if current[0] == peer_id and current[2] == endpoint:
+                logger.debug('Already connected to RPC endpoint of %s: %s', peer_name, endpoint)
+                return
+            # Same name for another peer, or the peer moved
+            self.disconnect(current[0], peer_name)
+
         rpc_client = _ZmqDealerSocket()
         logger.debug('Connecting to RPC endpoint of %s: %s', peer_name, endpoint)
         rpc_client.connect(endpoint)
-        self.rpc_clients[peer_name] = (peer_id, rpc_client)
+        self.rpc_clients[peer_name] = (peer_id, rpc_client, endpoint)
+
+    def disconnect(self, peer_id, peer_name):
+        current = self.rpc_clients.get(peer_name, None)
+        if (current is None) or (current[0] != peer_id):
+            # Already replaced by a peer of the same name
+            return
+
+        logger.debug('Closing RPC connection to %s', peer_name)
+        del self.rpc_clients[peer_name]
+        current[1].shutdown()
 
     def register(self, func, name=None):
         self.rpc_service.register(func, name=name)
@@ -52,18 +70,28 @@ class ZmqRPC(object):
         if name in self.rpc_service.procedures:
             del self.rpc_service.procedures[name]
 
+    def set_fallback(self, func):
+        self.rpc_service.fallback = func
+
     def call_on(self, peer_name, func_name, *args, **kwargs):
         return self.rpc_clients[peer_name][1].call(func_name, args=args, kwargs=kwargs)
 
     def shutdown(self):
         logger.debug('Shutting down RPC')
         self.rpc_service.shutdown()
+        for peer_id, rpc_client, endpoint in self.rpc_clients.values():
+            rpc_client.shutdown()
+        self.rpc_clients.clear()
 
 
 class RPCError(Exception):
     pass
 
 
+class UnknownProcedureError(RPCError):
+    pass
+
+
 class RemoteRPCError(RPCError):
 
     def __init__(self, ename, evalue, tb):
@@ -129,6 +157,11 @@ class _ZmqBaseSocket(object):
 
 class _ZmqDealerSocket(_ZmqBaseSocket):
 
+    def __init__(self, *args, **kwargs):
+        # Replies are read in order, so only one call can be in flight at a time
+        self._lock = Lock()
+        super().__init__(*args, **kwargs)
+
     def _create_socket(self):
         super()._create_socket()
         self.socket = self.context.socket(zmq.DEALER)
@@ -143,18 +176,28 @@ class _ZmqDealerSocket(_ZmqBaseSocket):
         msg_list.append(args_ser)
         msg_list.append(kwargs_ser)
 
-        # Send
-        logger.debug('Sending %r', msg_list)
-        self.socket.send_multipart(msg_list)
+        # Send and receive response
+        with self._lock:
+            logger.debug('Sending %r', msg_list)
+            self.socket.send_multipart(msg_list)
+            while True:
+                try:
+                    msg_list = self.socket.recv_multipart()
+                except zmq.ZMQError as ex:
+                    # Connection closed while waiting, the peer left
+                    raise RPCError(f'Connection lost while calling {proc_name}: {ex}')
+                if (len(msg_list) >= 4) and (msg_list[1] != req_id):
+                    # Late reply to a call that was cancelled while waiting
+                    logger.debug('Discarding reply to another request %r', msg_list)
+                    continue
+                break
 
-        # Receive response and validate
-        msg_list = self.socket.recv_multipart()
+        # Validate response
         if (len(msg_list) < 4) or (msg_list[0] != b'|'):
             logger.error('Bad reply %r', msg_list)
             return None
 
         # Parse response
-        recv_req_id = msg_list[1]
         msg_type = msg_list[2]
         if msg_type == b'OK':
             return json.loads(msg_list[3])
@@ -178,6 +221,7 @@ class _ZmqRouterSocket(_ZmqBaseSocket):
         super().__init__(self, *args, **kwargs)
 
         self.procedures = {}
+        self.fallback = None
         self._task = None
         self._executor = Executor(limit=1024)
 
@@ -228,16 +272,20 @@ class _ZmqRouterSocket(_ZmqBaseSocket):
         req_id = msg_list[boundary + 1]
         name = msg_list[boundary + 2].decode()
         proc = self.procedures.get(name, None)
+        if (proc is None) and (self.fallback is not None):
+            proc = self.fallback(name)
 
         args = json.loads(msg_list[boundary+3])
         kwargs = json.loads(msg_list[boundary+4])
 
-        if proc is None:
-            raise NotImplementedError(f'Unknown procedure {name}')
-
         # Actual call
         try:
+            if proc is None:
+                raise UnknownProcedureError(f'Unknown procedure {name}')
             result = proc(*args, **kwargs)
+        except UnknownProcedureError:
+            logger.warning('Rejecting call to unknown procedure %s', name)
+            self._send_fail(route, req_id)
         except Exception as ex:
             logger.exception('Exception while executing RPC request')
             self._send_fail(route, req_id)
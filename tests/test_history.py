@@ -0,0 +1,594 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import gc
+import json
+import logging  # noqa: F401
+import os
+from array import array
+from datetime import datetime, timedelta
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac import IsacNode, IsacValue, ArchivedValue, NoPeerWithHistoryException
+from isac.history import (
+    RingBufferStore, SegmentStore, aggregate, pack_columns, unpack_columns, merge_streams
+)
+from isac.history import aggregation, columnar
+from isac.tools import green
+from isac.tools.tests import m_two_nodes as two_nodes  # noqa: F401
+
+# logging.basicConfig(level=logging.DEBUG)
+
+
+def _fill(store, count, start=0):
+    for i in range(start, start + count):
+        store.append(float(i), float(i * 10), {'i': i // 10})
+
+
+def test_ring_buffer_range():
+    store = RingBufferStore(100)
+    _fill(store, 50)
+    assert len(store) == 50
+    assert store.first_ts == 0
+    assert store.last_ts == 49
+    assert store.range(10, 12) == [(100, 10, {'i': 1}), (110, 11, {'i': 1}), (120, 12, {'i': 1})]
+    assert store.range(48.5, 1000) == [(490, 49, {'i': 4})]
+    assert store.range(100, 200) == []
+    assert store.count(0, 49) == 50
+    assert list(store.iter_range(0, 1)) == store.range(0, 1)
+
+    with pytest.raises(ValueError):
+        RingBufferStore(0)
+
+
+def test_ring_buffer_wrap():
+    store = RingBufferStore(100)
+    _fill(store, 250)
+    assert len(store) == 100
+    assert store.first_ts == 150
+    assert store.last_ts == 249
+    assert store.range(0, 151) == [(1500, 150, {'i': 15}), (1510, 151, {'i': 15})]
+    assert [point[1] for point in store.range(195, 205)] == list(range(195, 206))
+    assert store.count(0, 1000) == 100
+
+    timestamps, values, tags = store.columns(198, 201)
+    assert list(timestamps) == [198, 199, 200, 201]
+    assert list(values) == [1980, 1990, 2000, 2010]
+    assert tags == [{'i': 19}, {'i': 19}, {'i': 20}, {'i': 20}]
+
+
+def test_ring_buffer_growth():
+    store = RingBufferStore(100)
+    assert len(store._ts) == 0
+    _fill(store, 20)
+    assert len(store._ts) == 32
+
+    # Growing while the ring wraps after a truncate keeps the points in order
+    store.truncate(15)
+    _fill(store, 40, start=20)
+    assert len(store._ts) == 64
+    assert [point[1] for point in store.range(0, 100)] == list(range(15, 60))
+
+    _fill(store, 100, start=60)
+    assert len(store._ts) == 100
+    assert [point[1] for point in store.range(0, 200)] == list(range(60, 160))
+
+
+def test_ring_buffer_shared_tags():
+    store = RingBufferStore(10)
+    tags = {'a': 'tag'}
+    store.append(1, 1, tags)
+    tags['b'] = 'tag'
+    store.append(2, 2, tags)
+    store.append(3, 3, tags)
+    points = store.range(0, 10)
+    assert points[0][2] == {'a': 'tag'}
+    assert points[1][2] == {'a': 'tag', 'b': 'tag'}
+    assert points[1][2] is points[2][2]
+
+
+def test_ring_buffer_non_numeric():
+    store = RingBufferStore(10)
+    store.append(1, 1.5, {})
+    store.append(2, 'a', {})
+    assert store.append(0, 'too old', {}) is False
+    assert store.range(0, 10) == [(1.5, 1, {}), ('a', 2, {})]
+
+
+def test_segment_store_range(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_points=64)
+    _fill(store, 200)
+    assert len(store) == 200
+    assert store.first_ts == 0
+    assert store.last_ts == 199
+    assert len(os.listdir(str(tmp_path))) == 8
+    assert store.range(10, 12) == [(100, 10, {'i': 1}), (110, 11, {'i': 1}), (120, 12, {'i': 1})]
+    assert [point[1] for point in store.range(60, 70)] == list(range(60, 71))
+    assert store.range(198.5, 1000) == [(1990, 199, {'i': 19})]
+    assert store.range(300, 400) == []
+    assert store.count(-10, 1000) == 200
+    assert store.append(150, 0, {}) is False
+
+    timestamps, values, tags = store.columns(62, 65)
+    assert list(timestamps) == [62, 63, 64, 65]
+    assert list(values) == [620, 630, 640, 650]
+    assert tags == [{'i': 6}] * 4
+    store.close()
+
+
+def test_segment_store_non_numeric(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    store.append(1, 1.5, {})
+    store.append(2, 'a', {'a': 'tag'})
+    store.append(3, None, None)
+    store.append(4, {'b': [1, 2]}, {'a': 'tag'})
+    assert store.range(0, 10) == [
+        (1.5, 1, {}), ('a', 2, {'a': 'tag'}), (None, 3, None), ({'b': [1, 2]}, 4, {'a': 'tag'})]
+    assert store.columns(0, 10)[1] == [1.5, 'a', None, {'b': [1, 2]}]
+    store.close()
+
+
+def test_store_integers(tmp_path):
+    # Integers are not turned into doubles, big ones would lose precision
+    big = 2 ** 60 + 1
+    for store in (RingBufferStore(100), SegmentStore(str(tmp_path), segment_points=4)):
+        store.append(1, 42, {})
+        store.append(2, big, {})
+        store.append(3, 1.5, {})
+        assert [point[0] for point in store.range(0, 10)] == [42, big, 1.5]
+        values = store.columns(0, 10)[1]
+        assert values == [42, big, 1.5]
+        assert type(values[0]) is int
+
+        timestamps, values, tags = unpack_columns(
+            json.loads(json.dumps(pack_columns(*store.columns(0, 10)))))
+        assert values == [42, big, 1.5]
+        if isinstance(store, SegmentStore):
+            store.close()
+
+
+def test_segment_store_reopen(tmp_path):
+    store = SegmentStore.for_uri(str(tmp_path), 'test://a/b', segment_points=64)
+    _fill(store, 100)
+    store.close()
+    assert os.listdir(str(tmp_path)) == ['test%3A%2F%2Fa%2Fb']
+
+    store = SegmentStore.for_uri(str(tmp_path), 'test://a/b', segment_points=64)
+    assert len(store) == 100
+    assert (store.first_ts, store.last_ts) == (0, 99)
+    _fill(store, 10, start=100)
+    assert [point[1] for point in store.range(95, 1000)] == list(range(95, 110))
+    store.close()
+
+
+def test_segment_store_compress(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_points=64, compress=True)
+    _fill(store, 150)
+    store.append(150, 'a', {'i': 'a'})
+    assert sorted(os.listdir(str(tmp_path))) == [
+        '00000000.gor', '00000001.gor', '00000002.aux', '00000002.seg']
+    assert store.range(62, 65) == [
+        (620, 62, {'i': 6}), (630, 63, {'i': 6}), (640, 64, {'i': 6}), (650, 65, {'i': 6})]
+    assert store.count(0, 1000) == 151
+    assert list(store.columns(127, 129)[1]) == [1270, 1280, 1290]
+    assert store.columns(149, 150)[1] == [1490, 'a']
+    store.close()
+
+    # Segments sealed without compression get compressed when reopening with it
+    store = SegmentStore(str(tmp_path), segment_points=64)
+    _fill(store, 100, start=151)
+    store.close()
+    assert '00000002.seg' in os.listdir(str(tmp_path))
+
+    store = SegmentStore(str(tmp_path), segment_points=64, compress=True)
+    assert sorted(name for name in os.listdir(str(tmp_path)) if name.endswith('.gor')) == [
+        '00000000.gor', '00000001.gor', '00000002.gor']
+    assert (len(store), store.first_ts, store.last_ts) == (251, 0, 250)
+    assert [point[0] for point in store.range(0, 1000)] == (
+        [i * 10 for i in range(150)] + ['a'] + [i * 10 for i in range(151, 251)])
+    store.close()
+
+
+def test_segment_store_crash_recovery(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    _fill(store, 10)
+    store.close()
+
+    seg_path = os.path.join(str(tmp_path), '00000000.seg')
+    with open(seg_path, 'r+b') as f:
+        # Corrupt the last record and leave a torn one after it
+        f.seek(-10, os.SEEK_END)
+        f.write(b'\xff' * 10)
+        f.seek(0, os.SEEK_END)
+        f.write(b'\x00' * 7)
+
+    store = SegmentStore(str(tmp_path))
+    assert len(store) == 9
+    assert store.last_ts == 8
+    store.append(9, 90, {'i': 0})
+    assert store.range(8, 9) == [(80, 8, {'i': 0}), (90, 9, {'i': 0})]
+    store.close()
+
+
+def test_store_chunk(tmp_path):
+    for store in (RingBufferStore(100), SegmentStore(str(tmp_path), segment_points=16)):
+        _fill(store, 20)
+        for i in range(5):
+            store.append(20.0, 200.0 + i, {})
+        _fill(store, 5, start=21)
+
+        chunks = []
+        cursor = None
+        while True:
+            points, cursor = store.chunk(5, 23, cursor, max_points=3)
+            chunks.append(points)
+            if cursor is None:
+                break
+        assert [point for points in chunks for point in points] == store.range(5, 23)
+        assert all(len(points) <= 3 for points in chunks)
+        assert chunks[5] == [(200, 20, {}), (201, 20, {}), (202, 20, {})]
+        assert chunks[6] == [(203, 20, {}), (204, 20, {}), (210, 21, {'i': 2})]
+        points, cursor = store.chunk(5, 23, (20, 4), max_points=2)
+        assert points == [(204, 20, {}), (210, 21, {'i': 2})]
+        assert cursor == (21, 1)
+
+
+def test_merge_streams():
+    a = [(1, 1, {}), (2, 2, {}), (2.5, 2, {}), (5, 5, {})]
+    b = [(0, 0, {}), (2, 2, {}), (3, 3, {}), (5, 5, {}), (6, 6, {})]
+    assert list(merge_streams([iter(a), iter(b)])) == [
+        (0, 0, {}), (1, 1, {}), (2, 2, {}), (2.5, 2, {}), (3, 3, {}), (5, 5, {}), (6, 6, {})]
+    assert list(merge_streams([iter(a)])) == a
+    assert list(merge_streams([])) == []
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def aggregate_impl(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(aggregation, 'numpy', None)
+    return request.param
+
+
+def test_aggregate(aggregate_impl):
+    timestamps = [0.0, 1.0, 4.5, 5.0, 9.9, 20.0]
+    values = [1.0, 3.0, 2.0, -1.0, 4.0, 7.0]
+    functions = ('min', 'max', 'mean', 'sum', 'count', 'first', 'last')
+    result = aggregate(timestamps, values, 5, functions)
+    assert result == [
+        [0, {'min': 1, 'max': 3, 'mean': 2, 'sum': 6, 'count': 3, 'first': 1, 'last': 2}],
+        [5, {'min': -1, 'max': 4, 'mean': 1.5, 'sum': 3, 'count': 2, 'first': -1, 'last': 4}],
+        [20, {'min': 7, 'max': 7, 'mean': 7, 'sum': 7, 'count': 1, 'first': 7, 'last': 7}],
+    ]
+    assert aggregate([], [], 5) == []
+
+    with pytest.raises(ValueError):
+        aggregate(timestamps, values, 0)
+    with pytest.raises(ValueError):
+        aggregate(timestamps, values, 5, ('median',))
+
+
+def test_aggregate_non_numeric(aggregate_impl):
+    result = aggregate([0, 1, 2], [1, 'a', 2], 10, ('min', 'count', 'first', 'last'))
+    assert result == [[0, {'min': None, 'count': 3, 'first': 1, 'last': 2}]]
+
+
+def test_store_aggregate(tmp_path, aggregate_impl):
+    ring = RingBufferStore(100)
+    _fill(ring, 250)
+    assert ring.aggregate(0, 1000, 50, ('min', 'max', 'count')) == [
+        [150, {'min': 1500, 'max': 1990, 'count': 50}],
+        [200, {'min': 2000, 'max': 2490, 'count': 50}],
+    ]
+
+    segments = SegmentStore(str(tmp_path), segment_points=64)
+    _fill(segments, 200)
+    assert segments.aggregate(10, 199, 100, ('mean', 'last')) == [
+        [0, {'mean': 545, 'last': 990}],
+        [100, {'mean': 1495, 'last': 1990}],
+    ]
+    segments.close()
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def columnar_impl(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(columnar, 'numpy', None)
+    return request.param
+
+
+def test_columns_packing(columnar_impl):
+    store = RingBufferStore(100)
+    _fill(store, 25)
+    packed = json.loads(json.dumps(pack_columns(*store.columns(5, 24))))
+    assert packed['tags'] == [[0, {'i': 0}], [5, {'i': 1}], [15, {'i': 2}]]
+
+    timestamps, values, tags = unpack_columns(packed)
+    assert list(timestamps) == list(range(5, 25))
+    assert list(values) == [i * 10 for i in range(5, 25)]
+    assert tags == [(0, {'i': 0}), (5, {'i': 1}), (15, {'i': 2})]
+    if columnar_impl == 'numpy':
+        assert timestamps.dtype.kind == 'f'
+        assert timestamps.flags.writeable and values.flags.writeable
+    else:
+        assert isinstance(values, array)
+
+    store.append(30, 'a', None)
+    timestamps, values, tags = unpack_columns(pack_columns(*store.columns(24, 30)))
+    assert list(timestamps) == [24, 30]
+    assert values == [240, 'a']
+    assert tags == [(0, {'i': 2}), (1, None)]
+
+    assert [list(column) for column in unpack_columns(pack_columns([], array('d'), []))] == [
+        [], [], []]
+
+
+def test_archived_value_records(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_archived_value_records/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = ArchivedValue(nB, uri, survey_static_tags=False, history_capacity=10)
+    assert len(ivB.history) == 0
+    green.sleep(0.1)  # Let the subscription reach nA
+
+    ivA.value = 1
+    ts1 = ivA.timestamp
+    green.sleep(0.1)
+    ivB.value = 2
+    assert [point[0] for point in ivB.history.range(0, ivB.timestamp_float)] == [1, 2]
+
+    data = ivA.get_history((0, ivB.timestamp_float))
+    assert data == [
+        (1, ts1, nA.name_uuid()),
+        (2, ivB.timestamp, nB.name_uuid()),
+    ]
+    assert isinstance(data[0][1], datetime)
+
+
+def test_archived_value_aggregated_history(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_archived_value_aggregated_history/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = ArchivedValue(nB, uri, survey_static_tags=False)
+    for i in range(100):
+        ivB.history.append(1000.0 + i / 10, i, {})
+
+    data = ivA.get_history(
+        (1000.0, 1010.0), bucket=timedelta(seconds=5), aggregates=('min', 'count'))
+    assert data == [
+        ({'min': 0, 'count': 50}, datetime.fromtimestamp(1000), {}),
+        ({'min': 50, 'count': 50}, datetime.fromtimestamp(1005), {}),
+    ]
+
+    with pytest.raises(ValueError):
+        ivA.get_history((1000.0, 1010.0), bucket=5, aggregates=('median',))
+
+
+def test_archived_value_iter_history(two_nodes, monkeypatch):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_archived_value_iter_history/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = ArchivedValue(nB, uri, survey_static_tags=False)
+    _fill(ivB.history, 1000)
+
+    points = ivA.iter_history((10, 989), chunk_size=64)
+    assert next(points) == (100, datetime.fromtimestamp(10), {'i': 1})
+    assert [point[0] for point in points] == [i * 10.0 for i in range(11, 990)]
+
+    # Stopping early does not disturb the following calls
+    points = ivA.iter_history((0, 1000), chunk_size=10)
+    assert next(points)[0] == 0
+    points.close()
+    assert ivA.get_history((0, 1))[1][0] == 10
+
+    # The archiver caps the chunk size, requesters still get every point
+    monkeypatch.setattr(ArchivedValue, 'max_chunk_points', 100)
+    points, cursor = ivB.get_history_chunk_impl((0, 1000), None, 10000)
+    assert len(points) == 100 and cursor is not None
+    assert len(list(ivA.iter_history((0, 1000), chunk_size=10000))) == 1000
+
+
+def test_archived_value_columnar_history(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_archived_value_columnar_history/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = ArchivedValue(nB, uri, survey_static_tags=False)
+    _fill(ivB.history, 100)
+
+    timestamps, values, tags = ivA.get_history((0, 99), columnar=True)
+    assert list(timestamps) == list(range(100))
+    assert list(values) == [i * 10 for i in range(100)]
+    assert tags == [(i * 10, {'i': i}) for i in range(10)]
+
+    timestamps, values, tags = ivA.get_history((0, 99), columnar=True, compressed=True)
+    assert list(timestamps) == list(range(100))
+    assert list(values) == [i * 10 for i in range(100)]
+    assert tags == [(i * 10, {'i': i}) for i in range(10)]
+    timestamps[0] = -1.0  # Columns are writable, numpy arrays or not
+    assert ivA.get_history((0, 99), compressed=True) == ivA.get_history((0, 99))
+
+    with pytest.raises(ValueError):
+        ivA.get_history((0, 99), bucket=10, columnar=True)
+
+
+def test_get_history_many(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_get_history_many/test_iv%d'
+    ivs = [ArchivedValue(nB, uri % i, survey_static_tags=False) for i in range(3)]
+    for i, iv in enumerate(ivs):
+        _fill(iv.history, 10 * (i + 1))
+    iv_a = ArchivedValue(nA, uri % 3, survey_static_tags=False)
+    _fill(iv_a.history, 5)
+    iv_simple = IsacValue(nB, uri % 4, survey_static_tags=False)  # noqa: F841
+
+    calls = []
+    call_on = nA.rpc.call_on
+    nA.rpc.call_on = lambda *args, **kwargs: calls.append(args[1]) or call_on(*args, **kwargs)
+
+    uris = [uri % i for i in (2, 4, 0, 5, 1, 3)]
+    results = nA.get_history_many(uris, (0, 100))
+    assert [None if data is None else len(data) for data in results] == [30, None, 10, None, 20, 5]
+    assert results[2][1] == (10, datetime.fromtimestamp(1), {'i': 0})
+    assert calls == ['get_history_many_impl']
+
+    results = nA.get_history_many(uris[:3], (0, 100), compressed=True)
+    assert results[2] == nA.get_history_many([uris[2]], (0, 100))[0]
+
+    results = nA.get_history_many(uris[:3], (0, 100), columnar=True)
+    assert list(results[0][0]) == list(range(30))
+    assert results[1] is None
+
+    results = nA.get_history_many(uris[:3], (0, 100), bucket=100, aggregates=('count',))
+    assert results[0] == [({'count': 30}, datetime.fromtimestamp(0), {})]
+
+
+def test_history_peer_cache(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_history/test_history_peer_cache/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = ArchivedValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+    _fill(ivB.history, 10)
+
+    surveys = []
+    survey_call = nA.surveys_manager.call
+    nA.surveys_manager.call = lambda *args, **kwargs: (
+        surveys.append(args[0]) or survey_call(*args, **kwargs))
+
+    try:
+        # Repeated queries go straight to the archiver
+        assert len(ivA.get_history((0, 100))) == 10
+        assert len(ivA.get_history((0, 100))) == 10
+        assert len(list(ivA.iter_history((0, 100)))) == 10
+        assert surveys == ['SurveyValueHistory']
+
+        # Peer leaving
+        nA._on_peer_gone(None, b'testB')
+        assert uri not in nA.history_peer_cache
+        assert len(ivA.get_history((0, 100))) == 10
+        assert len(surveys) == 2
+
+        # Stale archiver, surveyed again
+        nA.history_peer_cache.put(uri, b'testZ')
+        assert len(ivA.get_history((0, 100))) == 10
+        assert nA.history_peer_cache.peek(uri) == b'testB'
+        assert len(surveys) == 3
+
+        # Archiver dropping the value, nothing keeps it alive
+        del ivB
+        gc.collect()
+        assert uri not in nB.isac_values
+        assert uri not in nB.subscriptions()
+        with pytest.raises(NoPeerWithHistoryException):
+            ivA.get_history((0, 100))
+        assert uri not in nA.history_peer_cache
+    finally:
+        nA.surveys_manager.call = survey_call
+
+
+def test_archived_value_closes_history(tmp_path):
+    n = IsacNode('testA')
+    try:
+        uri = 'test://test_history/test_archived_value_closes_history/test_iv'
+        store = SegmentStore(str(tmp_path), segment_points=16)
+        iv = ArchivedValue(
+            n, uri, history=store, survey_last_value=False, survey_static_tags=False)
+        _fill(iv.history, 40)
+        assert len(iv.history.range(0, 100)) == 40
+        assert store._maps
+
+        del iv
+        gc.collect()
+        assert store._seg_file is None
+        assert not store._maps
+    finally:
+        n.shutdown()
+
+
+def test_history_peer_cache_size():
+    n = IsacNode('testA', last_value_cache_size=0, history_peer_cache_size=5)
+    try:
+        assert n.last_value_cache.maxsize == 0
+        assert n.history_peer_cache.maxsize == 5
+        assert n.history_peer_cache.enabled
+    finally:
+        n.shutdown()
+
+
+def test_merged_history():
+    nA = IsacNode('testA')
+    nB = IsacNode('testB')
+    nC = IsacNode('testC')
+
+    try:
+        uri = 'test://test_history/test_merged_history/test_iv'
+        iv = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+        ivB = ArchivedValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+        ivC = ArchivedValue(nC, uri, survey_last_value=False, survey_static_tags=False)
+
+        # nB was down between 50 and 80, nC only started at 40
+        _fill(ivB.history, 50)
+        _fill(ivB.history, 20, start=80)
+        _fill(ivC.history, 60, start=40)
+
+        assert len(iv.get_history((0, 100))) in (70, 60)
+        points = iv.get_history((0, 100), merge=True)
+        assert [point[0] for point in points] == [i * 10 for i in range(100)]
+        assert [point[0] for point in iv.iter_history((45, 85), chunk_size=7, merge=True)] == [
+            i * 10 for i in range(45, 86)]
+
+        with pytest.raises(ValueError):
+            iv.get_history((0, 100), bucket=10, merge=True)
+    finally:
+        nA.shutdown()
+        nB.shutdown()
+        nC.shutdown()
+
+
+def test_merged_history_first_chunks_in_parallel(monkeypatch):
+    nA = IsacNode('testA')
+    nB = IsacNode('testB')
+    nC = IsacNode('testC')
+
+    try:
+        uri = 'test://test_history/test_merged_history_first_chunks_in_parallel/test_iv'
+        iv = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+        ivB = ArchivedValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+        ivC = ArchivedValue(nC, uri, survey_last_value=False, survey_static_tags=False)
+        _fill(ivB.history, 10)
+        _fill(ivC.history, 10, start=10)
+        iv.get_history((0, 100), merge=True)  # Discover the archiving peers
+
+        events = []
+        call_on = nA.rpc.call_on
+
+        def slow_call_on(peer_name, *args, **kwargs):
+            events.append(('start', peer_name))
+            green.sleep(0.1)
+            result = call_on(peer_name, *args, **kwargs)
+            events.append(('end', peer_name))
+            return result
+
+        monkeypatch.setattr(nA.rpc, 'call_on', slow_call_on)
+        points = list(iv.iter_history((0, 100), merge=True))
+        assert [point[0] for point in points] == [i * 10 for i in range(20)]
+        assert [event[0] for event in events[:2]] == ['start', 'start']
+    finally:
+        nA.shutdown()
+        nB.shutdown()
+        nC.shutdown()
@@ -0,0 +1,78 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import math
+import random
+from array import array
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac.history import encode_block, decode_block
+
+
+def _series(count, period=0.1, jitter=0.0005):
+    rand = random.Random(42)
+    timestamps = array('d')
+    values = array('d')
+    ts = 1.6e9
+    value = 20.0
+    for i in range(count):
+        ts += period + rand.gauss(0, jitter)
+        value += rand.choice((0, 0, 0.5, -0.5))
+        timestamps.append(ts)
+        values.append(value)
+    return timestamps, values
+
+
+def test_round_trip():
+    timestamps, values = _series(5000)
+    tags = [{'a': i // 1000} for i in range(5000)]
+    block = encode_block(timestamps, values, tags)
+    assert len(block) < 5000 * 16 / 2
+
+    decoded_timestamps, decoded_values, sparse_tags = decode_block(block)
+    assert decoded_timestamps == timestamps
+    assert decoded_values == values
+    assert sparse_tags == [(i * 1000, {'a': i}) for i in range(5)]
+
+
+def test_regular_series():
+    timestamps = array('d', [1100.0 + i / 2 for i in range(1000)])
+    values = array('d', [1.5] * 1000)
+    block = encode_block(timestamps, values, [None] * 1000)
+    # One bit per timestamp and per value once the series is regular
+    assert len(block) < 2 * 1000 / 8 + 80
+    assert decode_block(block)[:2] == (timestamps, values)
+
+
+@pytest.mark.parametrize('values', [
+    array('d', [0.0, -0.0, 1e308, -1e-308, float('inf'), -float('inf'), 3.0, 3.0, 2.9]),
+    array('d', [float(2 ** i) for i in range(9)]),
+])
+def test_special_floats(values):
+    timestamps = array('d', [-5.0, 0.0, 1e-9, 1.0, 1.0, 2.0, 1e12, 1e12, 2e12])
+    decoded_timestamps, decoded_values, _ = decode_block(encode_block(timestamps, values, [{}] * 9))
+    assert decoded_timestamps == timestamps
+    assert [math.copysign(1, value) for value in decoded_values] == [
+        math.copysign(1, value) for value in values]
+    assert decoded_values == values
+
+
+def test_non_numeric():
+    timestamps = array('d', [1.0, 2.0, 3.0])
+    values = [1, 'a', {'b': None}]
+    assert decode_block(encode_block(timestamps, values, [{}, {}, {'c': 1}])) == (
+        timestamps, values, [(0, {}), (2, {'c': 1})])
+
+
+def test_empty():
+    assert decode_block(encode_block(array('d'), array('d'), [])) == (array('d'), array('d'), [])
+
+    with pytest.raises(ValueError):
+        decode_block(b'\x00' * 32)
@@ -0,0 +1,119 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import os
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac import IsacNode, IsacValue, ArchivedValue
+from isac.history import (
+    ColumnarFileWriter, ColumnarFileReader, RingBufferStore, export_store, export_path
+)
+from isac.tools import green, NeverYield
+
+
+def test_columnar_file(tmp_path):
+    path = str(tmp_path / 'test.isaccol')
+    with ColumnarFileWriter(path, metadata={'uri': 'test://a'}, block_points=4) as writer:
+        for i in range(10):
+            writer.append(float(i), i * 1.5, {'i': i // 3})
+        writer.append(10.0, 'a', None)
+        assert not os.path.exists(path)
+    assert (writer.points, writer.blocks) == (11, 3)
+
+    reader = ColumnarFileReader(path)
+    assert reader.metadata == {'uri': 'test://a'}
+    blocks = list(reader.iter_blocks())
+    assert [list(block[0]) for block in blocks] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10]]
+    assert list(blocks[1][1]) == [6, 7.5, 9, 10.5]
+    assert blocks[1][2] == [(0, {'i': 1}), (2, {'i': 2})]
+    assert blocks[2][1] == [12, 13.5, 'a']
+
+    points = list(reader)
+    assert len(points) == 11
+    assert points[3] == (4.5, 3, {'i': 1})
+    assert points[10] == ('a', 10, None)
+
+
+def test_columnar_file_abort(tmp_path):
+    path = str(tmp_path / 'test.isaccol')
+    with pytest.raises(RuntimeError):
+        with ColumnarFileWriter(path) as writer:
+            writer.append(1.0, 1.0, {})
+            raise RuntimeError()
+    assert os.listdir(str(tmp_path)) == []
+
+    with open(path, 'wb') as f:
+        f.write(b'\x00' * 16)
+    with pytest.raises(ValueError):
+        ColumnarFileReader(path)
+
+
+def test_export_store(tmp_path):
+    store = RingBufferStore(1000)
+    for i in range(1000):
+        store.append(float(i), float(i), {})
+
+    path = str(tmp_path / 'test.isaccol')
+    assert export_store(store, path, 100, 899, block_points=64) == 800
+    assert [point[1] for point in ColumnarFileReader(path)] == list(range(100, 900))
+
+
+def test_node_export_history(tmp_path):
+    node = IsacNode('test')
+
+    try:
+        uri = 'test://test_history_export/test_node_export_history/%s'
+        ivs = [
+            ArchivedValue(node, uri % name, survey_last_value=False, survey_static_tags=False)
+            for name in ('a', 'b', 'other')
+        ]
+        iv_plain = IsacValue(  # noqa: F841
+            node, uri % 'plain', survey_last_value=False, survey_static_tags=False)
+        for iv in ivs:
+            for i in range(100):
+                iv.history.append(float(i), float(i), {'uri': iv.uri})
+
+        directory = str(tmp_path / 'export')
+        exported = node.export_history('/(a|b|plain)$', (10, 19), directory, block_points=4)
+        assert exported == {uri % 'a': 10, uri % 'b': 10}
+        assert sorted(os.listdir(directory)) == sorted(
+            os.path.basename(export_path(directory, uri % name)) for name in ('a', 'b'))
+
+        reader = ColumnarFileReader(export_path(directory, uri % 'b'))
+        assert reader.metadata == {'uri': uri % 'b', 'time_period': [10, 19]}
+        assert list(reader)[0] == (10, 10, {'uri': uri % 'b'})
+    finally:
+        node.shutdown()
+
+
+def test_node_export_history_yields(tmp_path):
+    node = IsacNode('test', yield_policy=NeverYield())
+
+    try:
+        iv = ArchivedValue(
+            node, 'test://test_history_export/test_node_export_history_yields/test_iv',
+            survey_last_value=False, survey_static_tags=False)
+        for i in range(100):
+            iv.history.append(float(i), float(i), None)
+
+        # Another greenlet gets to run while the blocks are written
+        ticks = []
+
+        def ticker():
+            while True:
+                ticks.append(None)
+                green.sleep(0)
+
+        task = green.spawn(ticker)
+        node.export_history('test_iv$', (0, 99), str(tmp_path), block_points=10)
+        task.kill()
+        assert len(ticks) >= 5
+    finally:
+        node.shutdown()
@@ -0,0 +1,138 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging  # noqa: F401
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac import IsacNode, ArchivedValue
+from isac.history import Retention, RetentionPolicy, RingBufferStore, SegmentStore, TieredStore
+
+# logging.basicConfig(level=logging.DEBUG)
+
+
+def _fill(store, start, stop):
+    for i in range(start, stop):
+        store.append(float(i), float(i), {})
+
+
+def _tiered_store():
+    # Raw for 10 minutes, 1 minute buckets for 30 minutes, then 10 minutes buckets forever
+    store = TieredStore(Retention(raw=600, tiers=[(60, 1800), (600, None)]))
+    _fill(store, 0, 3600)
+    store.compact(now=3600)
+    return store
+
+
+def test_retention_policy():
+    short, long = Retention(raw=60), Retention(raw=3600, tiers=[(60, None)])
+    policy = RetentionPolicy([('^test://a/', short)])
+    policy.add_rule('test://', long)
+    assert policy.for_uri('test://a/b') is short
+    assert policy.for_uri('test://b/a') is long
+    assert policy.for_uri('other://a/b') is None
+
+    with pytest.raises(ValueError):
+        Retention(tiers=[(60, None), (10, None)])
+
+
+def test_truncate(tmp_path):
+    ring = RingBufferStore(100)
+    _fill(ring, 0, 150)
+    assert ring.truncate(120) == 70
+    assert (len(ring), ring.first_ts, ring.last_ts) == (30, 120, 149)
+    assert ring.truncate(0) == 0
+
+    segments = SegmentStore(str(tmp_path), segment_points=16)
+    _fill(segments, 0, 50)
+    assert segments.truncate(40) == 32
+    assert (len(segments), segments.first_ts) == (18, 32)
+    assert segments.truncate(1000) == 16
+    assert [point[1] for point in segments.range(0, 1000)] == [48, 49]
+    segments.close()
+
+
+def test_tiered_store_tier_capacity():
+    # Tiers are not limited by the raw capacity, only by their retention
+    store = TieredStore(Retention(raw=60, tiers=[(1, 3000), (60, None)]), capacity=100)
+    for start in range(0, 4000, 100):
+        _fill(store, start, start + 100)
+        store.compact(now=start + 100)
+    assert len(store.raw) == 60
+    assert (len(store.tiers[0]), store.tiers[0].first_ts) == (3000, 1000)
+    assert (len(store.tiers[1]), store.tiers[1].first_ts) == (66, 0)
+
+    unbounded = RingBufferStore(None)
+    _fill(unbounded, 0, 1000)
+    assert len(unbounded) == 1000
+    assert unbounded.first_ts == 0
+
+
+def test_tiered_store_compaction():
+    store = _tiered_store()
+    assert (len(store.raw), store.raw.first_ts) == (600, 3000)
+    tier = store.tiers[0]
+    assert (len(tier), tier.first_ts, tier.last_ts) == (30, 1800, 3540)
+    assert len(store.tiers[1]) == 6
+
+    value, ts, tags = store.tiers[1].range(600, 600)[0]
+    assert (value, ts) == (899.5, 600)
+    assert tags['aggregate'] == {
+        'min': 600, 'max': 1199, 'sum': 539700, 'count': 600, 'first': 600, 'last': 1199}
+
+    # Nothing new to compact
+    store.compact(now=3600)
+    assert (len(store.tiers[0]), len(store.tiers[1])) == (30, 6)
+
+
+def test_tiered_store_queries():
+    store = _tiered_store()
+
+    # Raw points are gone, the oldest data is in the coarsest tier
+    assert [point[0] for point in store.range(0, 3599)] == [
+        299.5, 899.5, 1499.5, 2099.5, 2699.5, 3299.5]
+    assert [point[1] for point in store.range(2000, 2200)] == [2040, 2100, 2160]
+    assert store.range(3500, 3501) == [(3500, 3500, {}), (3501, 3501, {})]
+
+    assert store.aggregate(0, 3599, 1200, ('min', 'max', 'mean', 'count')) == [
+        [0, {'min': 0, 'max': 1199, 'mean': 599.5, 'count': 1200}],
+        [1200, {'min': 1200, 'max': 2399, 'mean': 1799.5, 'count': 1200}],
+        [2400, {'min': 2400, 'max': 3599, 'mean': 2999.5, 'count': 1200}],
+    ]
+
+    # Points not compacted yet come from the raw tier
+    _fill(store, 3600, 3630)
+    buckets = store.aggregate(3000, 3700, 300, ('min', 'last', 'count'))
+    assert buckets[-1] == [3600, {'min': 3600, 'last': 3629, 'count': 30}]
+    assert [bucket[1]['count'] for bucket in buckets] == [300, 300, 30]
+
+
+def test_node_retention():
+    retention = Retention(raw=600, tiers=[(60, None)])
+    node = IsacNode('test', retention=RetentionPolicy([('/tiered$', retention)]))
+
+    try:
+        iv = ArchivedValue(
+            node, 'test://test_history_retention/test_node_retention/tiered',
+            survey_last_value=False, survey_static_tags=False
+        )
+        iv_plain = ArchivedValue(
+            node, 'test://test_history_retention/test_node_retention/plain',
+            survey_last_value=False, survey_static_tags=False
+        )
+        assert isinstance(iv.history, TieredStore)
+        assert iv.history.retention is retention
+        assert isinstance(iv_plain.history, RingBufferStore)
+
+        _fill(iv.history, 0, 1200)
+        node.compact_history(now=1200)
+        assert len(iv.history.tiers[0]) == 20
+        assert iv.history.raw.first_ts == 600
+    finally:
+        node.shutdown()
@@ -6,11 +6,16 @@
 
 # System imports
 import logging  # noqa: F401
+import os
+import tracemalloc
+import uuid
 
 # Third-party imports
+import pytest
 
 # Local imports
-from isac import IsacNode
+from isac import IsacNode, IsacValue
+from isac.tools import green, zmq
 
 
 # logging.basicConfig(level=logging.INFO)
@@ -36,3 +41,62 @@ def test_creation_double():
     finally:
         n1.shutdown()
         n2.shutdown()
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='Needs /proc/self/fd')
+def test_peer_churn():
+    nA = IsacNode('A')
+    nB = IsacNode('B')
+
+    # Endpoints of the short lived peers
+    context = zmq.Context.instance()
+    pub = context.socket(zmq.PUB)
+    router = context.socket(zmq.ROUTER)
+    endpoints = [
+        'tcp://127.0.0.1:%d' % socket.bind_to_random_port('tcp://127.0.0.1')
+        for socket in (pub, router)
+    ]
+
+    def fds():
+        green.sleep(0.5)  # Let ZMQ close what it has to
+        return len(os.listdir('/proc/self/fd'))
+
+    def churn(cycles):
+        for i in range(cycles):
+            peer_id, peer_name = uuid.uuid4(), ('C%d' % i).encode()
+            nA._on_new_peer(peer_id, peer_name, *endpoints)
+            if i % 10 == 0:  # ENTER again without EXIT
+                nA._on_new_peer(peer_id, peer_name, *endpoints)
+            nA._on_peer_gone(peer_id, peer_name)
+
+    try:
+        nB.add_rpc(lambda: 'pong', name='ping')
+
+        churn(10)
+        tracemalloc.start()
+        fds_before = fds()
+        memory_before = tracemalloc.get_traced_memory()[0]
+
+        churn(2000)
+
+        assert fds() <= fds_before + 2
+        assert tracemalloc.get_traced_memory()[0] - memory_before < 500000
+        assert list(nA.rpc.rpc_clients) == [b'B']
+        assert len(nA.pub_sub.peer_endpoints) == 1
+
+        # Connections to the remaining peer still work
+        assert nA.pub_sub.codec is not None
+        assert nA.call_rpc('rpc://B/ping') == 'pong'
+        uri = 'test://test_isac_node/test_peer_churn/test_iv'
+        ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+        ivB = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+        green.sleep(0.1)
+        ivB.value = 42
+        green.sleep(0.1)
+        assert ivA.value == 42
+    finally:
+        tracemalloc.stop()
+        pub.close(0)
+        router.close(0)
+        nA.shutdown()
+        nB.shutdown()
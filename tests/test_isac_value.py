@@ -14,7 +14,7 @@ import pytest
 
 # Local imports
 from isac import IsacNode, IsacValue, ArchivedValue, NoPeerWithHistoryException
-from isac.tools import green, Observable
+from isac.tools import green, Observable, NeverYield
 from isac.tools.tests import m_one_node as one_node, m_two_nodes as two_nodes  # noqa: F401
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -33,7 +33,6 @@ def test_creation_double():
         nB.shutdown()
 
 
-@pytest.mark.xfail  # noqa: F811
 def test_weakref(one_node):  # noqa: F811
     iv = IsacValue(
         one_node, 'test://test_isac_value/test_weakref/test_iv',
@@ -43,6 +42,34 @@ def test_weakref(one_node):  # noqa: F811
     assert one_node.isac_values.valuerefs() == []
 
 
+def test_lazy_allocations(one_node):  # noqa: F811
+    iv = IsacValue(
+        one_node, 'test://test_isac_value/test_lazy_allocations/test_iv',
+        survey_last_value=False, survey_static_tags=False
+    )
+    assert not hasattr(iv, '__dict__')
+    assert iv._observers is None
+    assert iv._metadata_observers is None
+    assert iv._dynamic_tags is iv._static_tags  # Both still the shared empty tags
+    assert iv.static_tags == {}
+
+    iv.observers += lambda *args: None
+    assert len(iv.observers) == 1
+    iv.tags['a'] = 'tag'
+    assert iv.tags == {'a': 'tag'}
+    assert iv.static_tags == {}
+    iv.static_tags['unit'] = 'C'
+    assert iv.static_tags == {'unit': 'C'}
+
+    # An empty dict given by the caller is kept as is
+    static_tags = {}
+    iv = IsacValue(
+        one_node, 'test://test_isac_value/test_lazy_allocations/test_iv_static',
+        static_tags=static_tags, survey_last_value=False, survey_static_tags=False
+    )
+    assert iv.static_tags is static_tags
+
+
 def test_creation_no_init(two_nodes):  # noqa: F811
     nA, nB = two_nodes
 
@@ -134,6 +161,78 @@ def test_creation_with_full_init(two_nodes):  # noqa: F811
     assert ivA.metadata is None
 
 
+def test_create_values(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_isac_value/test_create_values/test_iv'
+    static_tags = {'this': 'is', 'static': 'tags'}
+    ivAs = [
+        IsacValue(nA, uri + '0', 0, survey_last_value=False, survey_static_tags=False),
+        IsacValue(
+            nA, uri + '1', static_tags=static_tags,
+            survey_last_value=False, survey_static_tags=False
+        ),
+    ]
+
+    ivBs = nB.create_values(uri + str(i) for i in range(3))
+    assert [ivB.uri for ivB in ivBs] == [uri + '0', uri + '1', uri + '2']
+    assert ivBs[0].value_ts_tags == ivAs[0].value_ts_tags
+    assert ivBs[0].static_tags == {}
+    assert ivBs[1].value_ts == (None, datetime(1970, 1, 1, 0, 0))
+    assert ivBs[1].static_tags == static_tags
+    assert ivBs[2].value is None
+    assert ivBs[2].static_tags == {}
+
+    ivAs[0].value = 10
+    assert ivBs[0].value == 10
+
+
+def test_creation_background_survey(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_isac_value/test_creation_background_survey/test_iv'
+    static_tags = {'this': 'is', 'static': 'tags'}
+    v1 = randint(0, 100)
+    ts1 = datetime.now() - timedelta(hours=1)
+    ivA = IsacValue(
+        nA, uri, (v1, ts1), static_tags=static_tags,
+        survey_last_value=False, survey_static_tags=False
+    )
+
+    ivB = IsacValue(nB, uri, background_survey=True)
+    assert ivB.value is None
+    assert ivB.survey_future.result(timeout=1) is None
+    assert ivB.value_ts == (v1, ts1)
+    assert ivB.static_tags == static_tags
+
+    ivB = None
+    ts2 = datetime.now() - timedelta(hours=2)
+    ivB = IsacValue(nB, uri, (v1 + 10, ts2), survey_static_tags=False, background_survey=True)
+    assert ivB.value_ts == (v1 + 10, ts2)
+    ivB.survey_future.result(timeout=1)
+    assert ivB.value_ts == (v1, ts1)
+
+    ivB = None
+    ts3 = datetime.now()
+    ivB = IsacValue(nB, uri, (v1 + 20, ts3), survey_static_tags=False, background_survey=True)
+    ivB.survey_future.result(timeout=1)
+    assert ivB.value_ts == (v1 + 20, ts3)
+    assert ivA.value_ts == (v1 + 20, ts3)
+
+
+def test_background_survey_value_set_early(two_nodes, caplog):  # noqa: F811
+    nA, nB = two_nodes
+
+    # Nobody else knows the value, the driver sets it before the survey ends
+    uri = 'test://test_isac_value/test_background_survey_value_set_early/test_iv'
+    iv = IsacValue(nA, uri, survey_static_tags=False, background_survey=True)
+    iv.value = 42
+    with caplog.at_level(logging.WARNING, logger='isac.isac_value'):
+        iv.survey_future.result(timeout=1)
+    assert iv.value == 42
+    assert not [record for record in caplog.records if record.name == 'isac.isac_value']
+
+
 def test_creation_static_tags(two_nodes):  # noqa: F811
     nA, nB = two_nodes
 
@@ -250,6 +349,19 @@ def test_property_value_ts(two_nodes):  # noqa: F811
     assert ivB.timestamp == ts1
     assert datetime.fromtimestamp(ivB.timestamp_float) == ts1
 
+
+def test_property_value_ts_float(one_node):  # noqa: F811
+    uri = 'test://test_isac_value/test_property_value_ts_float/test_property_value_ts_float'
+    iv = IsacValue(one_node, uri, survey_last_value=False, survey_static_tags=False)
+
+    ts = 1234567890.123456
+    iv.value_ts = 1, ts
+    assert iv.timestamp_float == ts
+    assert iv.timestamp == datetime.fromtimestamp(ts)
+
+    iv.update_value_from_isac(2, ts + 1, {})
+    assert iv.value_ts == (2, datetime.fromtimestamp(ts + 1))
+
 # TODO: test_property_static_tags
 
 
@@ -353,6 +465,52 @@ def test_property_value_ts_tags(two_nodes):  # noqa: F811
     assert ivB.value_ts_tags == (v, ts, dynamic_tags2_full)
 
 
+def test_yield_policy(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_isac_value/test_yield_policy/test_yield_policy'
+    policy = NeverYield()
+    ivA = IsacValue(
+        nA, uri, randint(0, 100), yield_policy=policy,
+        survey_last_value=False, survey_static_tags=False
+    )
+    assert ivA.yield_policy is policy
+    assert ivA.value_nowait == ivA.value
+    assert ivA.snapshot() == (ivA.value, ivA.timestamp_float, ivA.tags)
+
+    ivB = IsacValue(nB, uri, survey_static_tags=False)
+    assert ivB.yield_policy is nB.yield_policy
+
+
+def test_publish_batch(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_isac_value/test_publish_batch/test_publish_batch'
+    ivAs = [
+        IsacValue(nA, uri + str(i), survey_last_value=False, survey_static_tags=False)
+        for i in range(3)
+    ]
+    ivBs = [IsacValue(nB, uri + str(i), survey_static_tags=False) for i in range(3)]
+
+    sent = []
+    publish_many = nA.pub_sub.publish_many
+    nA.pub_sub.publish_many = lambda items: sent.append(items) or publish_many(items)
+    try:
+        with nA.batch():
+            for i, ivA in enumerate(ivAs):
+                ivA.value = i
+            with nA.batch():
+                ivAs[0].value = 10
+        nA.publish_many([(ivA, ivA.value_nowait + 100) for ivA in ivAs])
+    finally:
+        del nA.pub_sub.publish_many
+
+    assert [len(items) for items in sent] == [4, 3]
+    green.sleep(0.1)
+    assert [ivB.value for ivB in ivBs] == [110, 101, 102]
+    assert [ivB.timestamp for ivB in ivBs] == [ivA.timestamp for ivA in ivAs]
+
+
 def test_property_metadata(two_nodes):  # noqa: F811
     nA, nB = two_nodes
 
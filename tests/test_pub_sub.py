@@ -0,0 +1,212 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import json
+import logging  # noqa: F401
+import uuid
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac import IsacNode, IsacValue
+from isac.tools import green, zmq
+from isac.transport import CODECS
+from isac.transport.zmq_pub_sub import topic_id
+from isac.tools.tests import m_two_nodes as two_nodes  # noqa: F401
+
+# logging.basicConfig(level=logging.DEBUG)
+
+TAGS = {'peer_name': 'testA', 'unit': 'C'}
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+@pytest.mark.parametrize('data', [
+    (21.5, 1000.25, TAGS),
+    (-42, 1000.25, TAGS),
+    (None, 1000.25, {}),
+    (True, 1000.25, TAGS),
+    ('on', 1000.25, TAGS),
+    ({'x': [1, 2]}, 1000.25, TAGS),
+    (2 ** 70, 1000.25, TAGS),
+    [('test://a', (1.5, 1000.25, TAGS)), ('test://b', ('off', 1001.0, {}))],
+])
+def test_codec_round_trip(codec, data):
+    codec = CODECS[codec]
+    decoded = codec.decode(codec.encode(data))
+
+    def as_lists(data):
+        if isinstance(data, (tuple, list)):
+            return [as_lists(item) for item in data]
+        return data
+
+    assert decoded == as_lists(data)
+    if isinstance(data, tuple):
+        assert type(decoded[0]) is type(data[0])
+
+
+def test_struct_codec_size():
+    codec = CODECS['struct']
+    data = (21.123456789, 1600000000.123456, TAGS)
+    assert len(codec.encode(data)) < len(CODECS['json'].encode(data))
+
+
+def _exchange(nA, nB, uri):
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+    green.sleep(0.1)  # Let the subscription reach nA
+
+    ivA.value = 1.5
+    green.sleep(0.1)
+    assert ivB.value == 1.5
+
+    with nA.batch():
+        ivA.value = 2
+    green.sleep(0.1)
+    assert ivB.value == 2
+
+
+def test_codec_negotiation():
+    nA = IsacNode('testA')
+    nB = IsacNode('testB', pub_codecs=('struct', 'json'))
+
+    try:
+        assert nA.pub_sub.codec.name == 'struct'
+        assert nB.pub_sub.codec.name == 'struct'
+        _exchange(nA, nB, 'test://test_pub_sub/test_codec_negotiation/test_iv')
+
+        # Peers not advertising codecs only read and send legacy JSON messages
+        for node in (nA, nB):
+            peer_id, = node.pub_sub.peer_codecs
+            node.pub_sub.peer_codecs[peer_id] = None
+            node.pub_sub._negotiate_codec()
+            assert node.pub_sub.codec is None
+        _exchange(nA, nB, 'test://test_pub_sub/test_codec_negotiation/test_iv_legacy')
+
+        # Batches are not sent on BATCH_TOPIC, that legacy peers do not subscribe to
+        uri = 'test://test_pub_sub/test_codec_negotiation/test_iv_legacy_batch%d'
+        ivs = [
+            IsacValue(nA, uri % i, survey_last_value=False, survey_static_tags=False)
+            for i in range(2)
+        ]
+        legacy_sub = zmq.Context.instance().socket(zmq.SUB)
+        try:
+            legacy_sub.connect('tcp://127.0.0.1:%d' % nA.pub_sub.pub_port)
+            for i in range(2):
+                legacy_sub.setsockopt(zmq.SUBSCRIBE, (uri % i).encode())
+            green.sleep(0.1)  # Let the subscriptions reach nA
+
+            nA.publish_many([(iv, 10 + i) for i, iv in enumerate(ivs)])
+            received = []
+            for i in range(2):
+                with green.Timeout(1):
+                    received.append(legacy_sub.recv_multipart())
+            assert [topic for topic, payload in received] == [(uri % i).encode() for i in range(2)]
+            assert [json.loads(payload)[0] for topic, payload in received] == [10, 11]
+        finally:
+            legacy_sub.close(0)
+
+        peer_id, = nA.pub_sub.peer_codecs
+        nA.pub_sub.disconnect(peer_id, b'testB')
+        assert nA.pub_sub.codec.name == nA.pub_sub.codecs[0]
+
+        # Pyre has no header for a peer not advertising codecs
+        ghost_id = uuid.uuid4()
+        nA.pub_sub.connect(ghost_id, b'ghost', 'tcp://127.0.0.1:%d' % nB.pub_sub.pub_port)
+        assert nA.pub_sub.peer_codecs[ghost_id] is None
+        assert nA.pub_sub.codec is None
+        nA.pub_sub.disconnect(ghost_id, b'ghost')
+    finally:
+        nA.shutdown()
+        nB.shutdown()
+
+
+def test_exact_topics(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_pub_sub/test_exact_topics/temp'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivA2 = IsacValue(nA, uri + '2', survey_last_value=False, survey_static_tags=False)
+    ivB = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+    green.sleep(0.1)  # Let the subscription reach nA
+
+    discarded = nB.pub_sub.discarded_messages
+    ivA2.value = 1
+    ivA.value = 2
+    green.sleep(0.1)
+    assert ivB.value == 2
+    assert nB.pub_sub.discarded_messages == discarded
+
+    # Batches reach every node, their updates are filtered after decoding
+    nA.publish_many([(ivA2, 5), (ivA, 6)])
+    green.sleep(0.1)
+    assert ivB.value == 6
+    assert nB.pub_sub.discarded_messages == discarded + 1
+    discarded += 1
+
+    # Legacy peers send raw URIs, which prefix match
+    peer_codecs = {}
+    for node in (nA, nB):
+        peer_id, = node.pub_sub.peer_codecs
+        peer_codecs[node] = (peer_id, node.pub_sub.peer_codecs[peer_id])
+        node.pub_sub.peer_codecs[peer_id] = None
+        node.pub_sub._negotiate_codec()
+    try:
+        green.sleep(0.1)
+        ivA2.value = 3
+        ivA.value = 4
+        green.sleep(0.1)
+        assert nB.pub_sub.discarded_messages == discarded + 1
+        assert ivB.value == 4
+    finally:
+        for node, (peer_id, codecs) in peer_codecs.items():
+            node.pub_sub.peer_codecs[peer_id] = codecs
+            node.pub_sub._negotiate_codec()
+
+
+def test_topic_id():
+    uri = 'test://test_pub_sub/test_topic_id/a_rather_long_uri_for_a_temperature'
+    assert topic_id(uri) == topic_id(uri)
+    assert len(topic_id(uri)) == len(topic_id(uri + '2')) == 9
+    assert topic_id(uri) != topic_id(uri + '2')
+
+
+def test_subscriptions(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_pub_sub/test_subscriptions/test_iv'
+    ivA = IsacValue(nA, uri, survey_last_value=False, survey_static_tags=False)
+    ivB = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+    ivB2 = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)
+    green.sleep(0.1)  # Let the subscription reach nA
+
+    for i in range(5):
+        ivA.value = i
+    green.sleep(0.1)
+    subscription = nB.subscriptions()[uri]
+    assert subscription['holders'] == 2
+    assert subscription['messages'] == 5
+    assert subscription['rate'] > 0
+
+    del ivB
+    assert nB.subscriptions()[uri]['holders'] == 1
+    del ivB2
+    assert uri not in nB.subscriptions()
+
+    # nB does not receive updates any more
+    received = []
+    callback = nB.pub_sub.callback
+    nB.pub_sub.callback = lambda *args: received.append(args[0]) or callback(*args)
+    try:
+        discarded = nB.pub_sub.discarded_messages
+        green.sleep(0.1)
+        ivA.value = 10
+        green.sleep(0.1)
+        assert received == []
+        assert nB.pub_sub.discarded_messages == discarded
+    finally:
+        nB.pub_sub.callback = callback
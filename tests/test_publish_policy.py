@@ -0,0 +1,137 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging  # noqa: F401
+
+# Third-party imports
+
+# Local imports
+from isac import IsacValue, PublishPolicy
+from isac.tools import green
+from isac.tools.tests import m_two_nodes as two_nodes  # noqa: F401
+
+# logging.basicConfig(level=logging.DEBUG)
+
+
+class Publisher(object):
+
+    def __init__(self):
+        self.values = []
+
+    def publish(self, value, ts_float, tags):
+        self.values.append(value)
+
+
+def _submit_all(policy, values):
+    pub = Publisher()
+    for ts, value in enumerate(values):
+        policy.submit(pub.publish, value, float(ts), {})
+    return pub
+
+
+def test_no_policy():
+    policy = PublishPolicy()
+    pub = _submit_all(policy, [1, 1, 2, 2])
+    assert pub.values == [1, 1, 2, 2]
+    assert policy.published == 4
+    assert policy.suppressed == 0
+
+
+def test_deadband():
+    policy = PublishPolicy(deadband=0.5)
+    pub = _submit_all(policy, [1, 1.2, 1.5, 1.6, 0.5, 'a', 'a'])
+    assert pub.values == [1, 1.6, 0.5, 'a', 'a']
+    assert policy.suppressed == 2
+
+
+def test_relative_deadband():
+    policy = PublishPolicy(relative_deadband=0.1)
+    pub = _submit_all(policy, [100, 105, 111, 120, 123])
+    assert pub.values == [100, 111, 123]
+    assert policy.suppressed == 2
+
+
+def test_min_interval_trailing():
+    policy = PublishPolicy(min_interval=0.1)
+    pub = _submit_all(policy, [1, 2, 3, 4])
+    assert pub.values == [1]
+    assert policy.suppressed == 3
+
+    green.sleep(0.15)
+    assert pub.values == [1, 4]
+    assert policy.published == 2
+
+
+def test_min_interval_trailing_latest():
+    # Back within the deadband of the last published value, nothing trails
+    policy = PublishPolicy(deadband=1, min_interval=0.1)
+    pub = _submit_all(policy, [0.0, 5.0, 0.1])
+    green.sleep(0.15)
+    assert pub.values == [0.0]
+
+    policy = PublishPolicy(change_only=True, min_interval=0.1)
+    pub = _submit_all(policy, ['a', 'b', 'a'])
+    green.sleep(0.15)
+    assert pub.values == ['a']
+
+
+def test_min_interval_no_trailing():
+    policy = PublishPolicy(min_interval=0.1, trailing=False)
+    pub = _submit_all(policy, [1, 2, 3, 4])
+    green.sleep(0.15)
+    assert pub.values == [1]
+
+    policy.submit(pub.publish, 5, 5.0, {})
+    assert pub.values == [1, 5]
+
+
+def test_change_only():
+    policy = PublishPolicy(change_only=True)
+    pub = _submit_all(policy, [1, 1, 2, 2, 1])
+    assert pub.values == [1, 2, 1]
+    assert policy.suppressed == 2
+
+    policy.submit(pub.publish, 1, 5.0, {'new': 'tag'})
+    assert pub.values == [1, 2, 1, 1]
+
+
+def test_change_only_keepalive():
+    policy = PublishPolicy(change_only=True, keepalive=0.1)
+    pub = _submit_all(policy, [1, 1, 1])
+    assert pub.values == [1]
+
+    green.sleep(0.15)
+    pub2 = _submit_all(policy, [1, 1])
+    assert pub2.values == [1]
+    assert policy.published == 2
+    assert policy.suppressed == 3
+
+
+def test_isac_value_policy(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_publish_policy/test_isac_value_policy/test_iv'
+    ivA = IsacValue(
+        nA, uri, 1.0, metadata={'publish_policy': {'deadband': 1, 'min_interval': 0.2}},
+        survey_last_value=False, survey_static_tags=False
+    )
+    ivB = IsacValue(nB, uri, survey_static_tags=False)
+    assert ivA.publish_policy.deadband == 1
+    assert ivB.publish_policy is None
+    assert ivB.value == 1.0
+
+    ivA.value = 1.5
+    ivA.value = 3.0
+    ivA.value = 4.5
+    green.sleep(0.05)
+    assert ivA.value == 4.5
+    assert ivB.value == 1.0
+    assert ivA.publish_policy.suppressed == 3
+
+    green.sleep(0.25)
+    assert ivB.value == 4.5
+    assert ivB.timestamp == ivA.timestamp
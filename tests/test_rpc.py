@@ -8,8 +8,11 @@
 import logging  # noqa: F401
 
 # Third-party imports
+import pytest
 
 # Local imports
+from isac import IsacValue
+from isac.transport import RemoteRPCError
 from isac.tools.tests import m_two_nodes as two_nodes  # noqa: F401
 
 
@@ -36,3 +39,25 @@ def test_isac_node(two_nodes):  # noqa: F811
     assert spy['a'] == 4
     assert spy['b'] == 5
     assert spy['c'] == 6
+
+
+def test_isac_value(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_rpc/test_isac_value/my_value'
+    iv = IsacValue(nA, uri, 42, survey_last_value=False, survey_static_tags=False)
+
+    assert uri not in nA.rpc.rpc_service.procedures
+    assert nB.rpc.call_on(b'testA', uri) == [42, iv.timestamp_float]
+
+
+def test_unknown_procedure(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    with pytest.raises(RemoteRPCError) as excinfo:
+        nB.call_rpc('rpc://testA/not_a_procedure')
+    assert excinfo.value.ename == 'UnknownProcedureError'
+
+    # The service is still answering
+    nA.add_rpc(lambda: 'ok', name='still_there')
+    assert nB.call_rpc('rpc://testA/still_there') == 'ok'
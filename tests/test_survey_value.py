@@ -12,7 +12,8 @@ from random import randint
 # Third-party imports
 
 # Local imports
-from isac import IsacValue, ArchivedValue
+from isac import IsacNode, IsacValue, ArchivedValue
+from isac.tools import green
 from isac.tools.tests import m_two_nodes as two_nodes  # noqa: F401
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -39,6 +40,39 @@ def test_survey_last_value(two_nodes):  # noqa: F811
     ) == (None, 0, {})
 
 
+def test_survey_last_value_cache():
+    nA = IsacNode('testA')
+    nB = IsacNode('testB', last_value_cache_ttl=10)
+
+    try:
+        uri = 'test://test_survey_value/test_survey_last_value_cache/my_value'
+        iv = IsacValue(nA, uri, 1, survey_last_value=False, survey_static_tags=False)
+        last_value = (1, iv.timestamp_float, nA.name_uuid())
+
+        assert nB.survey_last_value(uri, limit_peers=1) == last_value
+        assert nB.last_value_cache.misses == 1
+
+        # Not seen by nB as it does not subscribe to it: the cache answers
+        iv.value = 2
+        cached = nB.survey_last_value(uri, limit_peers=1)
+        assert cached == last_value
+        assert nB.last_value_cache.hits == 1
+        cached[2]['changed'] = True
+        assert nB.last_value_cache.peek(uri)[2] == nA.name_uuid()
+        assert nB.survey_last_value(uri, limit_peers=1, use_cache=False)[0] == 2
+
+        # Updates received on subscribed values feed the cache
+        ivB = IsacValue(nB, uri, survey_last_value=False, survey_static_tags=False)  # noqa: F841
+        green.sleep(0.1)  # Let the subscription reach nA
+        iv.value = 3
+        green.sleep(0.1)
+        assert nB.survey_last_value(uri, limit_peers=1)[0] == 3
+        assert nB.last_value_cache.hits == 2
+    finally:
+        nA.shutdown()
+        nB.shutdown()
+
+
 def test_survey_value_uri(two_nodes):  # noqa: F811
     nA, nB = two_nodes
 
@@ -142,3 +176,21 @@ def test_survey_value_history(two_nodes):  # noqa: F811
         'test://test_survey_value/test_survey_value_history/unknown',
         (0, 1000), timeout=0.1
     ) is None
+
+
+def test_survey_values_state(two_nodes):  # noqa: F811
+    nA, nB = two_nodes
+
+    uri = 'test://test_survey_value/test_survey_values_state/'
+    iv_static = IsacValue(
+        nA, uri + 'static', static_tags={'this': 'is', 'static': 'tags'},
+        survey_last_value=False, survey_static_tags=False
+    )
+    iv_value = IsacValue(nA, uri + 'value', 1, survey_last_value=False, survey_static_tags=False)
+    iv_new = IsacValue(nA, uri + 'new', survey_last_value=False, survey_static_tags=False)
+
+    states = nB.survey_values_state([uri + 'static', uri + 'value', uri + 'new', uri + 'unknown'])
+    assert states == {
+        uri + 'static': ((None, 0, {}), iv_static.static_tags),
+        uri + 'value': ((1, iv_value.timestamp_float, nA.name_uuid()), {}),
+    }
@@ -0,0 +1,68 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging  # noqa: F401
+
+# Third-party imports
+
+# Local imports
+from isac.tools import green, TTLCache
+
+# logging.basicConfig(level=logging.DEBUG)
+
+
+def test_disabled():
+    cache = TTLCache()
+    assert not cache.enabled
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_hits_misses():
+    cache = TTLCache(ttl=10)
+    assert cache.get('a') is None
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    assert cache.pop('a') == 1
+    assert cache.get('a') is None
+    assert cache.misses == 2
+
+
+def test_ttl():
+    cache = TTLCache(ttl=0.05)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    green.sleep(0.1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.peek('a') == 1
+    assert cache.peek('b') is None
+    assert cache.peek('c') == 3
+
+
+def test_evict():
+    cache = TTLCache(ttl=10)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('c', 1)
+    assert cache.evict(lambda key, value: value == 1) == 2
+    assert cache.peek('a') is None
+    assert cache.peek('b') == 2
+    assert cache.peek('c') is None
@@ -0,0 +1,59 @@
+# Copyright (c) 2015-2020 Contributors as noted in the AUTHORS file
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# System imports
+import logging  # noqa: F401
+
+# Third-party imports
+import pytest
+
+# Local imports
+from isac.tools import green, AlwaysYield, NeverYield, YieldEvery, YieldTimeSliced
+
+# logging.basicConfig(level=logging.DEBUG)
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def run(self):
+        while True:
+            self.count += 1
+            green.sleep(0)
+
+
+def _count_switches(policy, reads):
+    counter = Counter()
+    task = green.spawn(counter.run)
+    green.sleep(0)
+    start = counter.count
+    for i in range(reads):
+        policy()
+    switches = counter.count - start
+    task.kill()
+    return switches
+
+
+def test_always_yield():
+    assert _count_switches(AlwaysYield(0), 10) == 10
+
+
+def test_never_yield():
+    assert _count_switches(NeverYield(), 10) == 0
+
+
+def test_yield_every():
+    assert _count_switches(YieldEvery(5, duration=0), 20) == 4
+
+    with pytest.raises(ValueError):
+        YieldEvery(0)
+
+
+def test_yield_time_sliced():
+    assert _count_switches(YieldTimeSliced(time_slice=3600), 100) == 0
+    assert _count_switches(YieldTimeSliced(time_slice=0), 10) == 10